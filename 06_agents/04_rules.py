@@ -20,13 +20,17 @@ import requests      # for HTTP requests
 ## 0.2 Load Functions #################################
 
 # Load helper functions for agent orchestration
-from functions import agent_run, get_shortages, df_as_text
+from functions import agent_run, get_shortages, df_as_text, warmup
 
 # 1. CONFIGURATION ###################################
 
 # Select model of interest
 MODEL = "smollm2:135m"
 
+# Start loading the model in the background now,
+# so it is ready by the time the first agent runs
+warmup(MODEL)
+
 # 2. LOAD RULES FROM YAML ###################################
 
 # Rules are structured guidance that can be incorporated into agent prompts
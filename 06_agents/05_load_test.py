@@ -0,0 +1,103 @@
+# 05_load_test.py
+# Load Testing Agent Helpers with a Mock Ollama Server
+# Pairs with mock_ollama.py
+# Tim Fraser
+
+# This script sends many concurrent agent requests to the mock Ollama server
+# and reports throughput and latency. With the "instant" profile, the numbers
+# measure only our own client code (HTTP, JSON, tool calls), not the model.
+# Students learn how to benchmark an AI pipeline without installing a model.
+
+# Examples:
+# python 05_load_test.py
+# python 05_load_test.py --profile small --requests 200 --concurrency 32
+# python 05_load_test.py --functions ../07_rag/functions.py   # test the RAG helpers
+
+# 0. SETUP ###################################
+
+## 0.1 Load Packages #################################
+
+import argparse  # for command line options
+import importlib.util  # for loading a functions.py file from another folder
+import statistics  # for latency percentiles
+import time      # for timing
+from concurrent.futures import ThreadPoolExecutor  # for concurrent requests
+from pathlib import Path
+
+from mock_ollama import PROFILES, start_server
+
+## 0.2 Options #################################
+
+parser = argparse.ArgumentParser(description="Load test agent helpers against a mock Ollama server")
+parser.add_argument("--requests", type=int, default=500, help="total number of agent calls")
+parser.add_argument("--concurrency", type=int, default=16, help="number of calls in flight at once")
+parser.add_argument("--profile", default="instant", choices=sorted(PROFILES))
+parser.add_argument("--tools", action="store_true", help="send a tool with every call")
+parser.add_argument("--functions", default=str(Path(__file__).resolve().parent / "functions.py"),
+                    help="path to the functions.py whose agent_run() we test")
+args = parser.parse_args()
+
+## 0.3 Load the Helper Functions #################################
+
+# Load functions.py from the chosen folder (06_agents, 07_rag, 08_function_calling, ...)
+spec = importlib.util.spec_from_file_location("functions_under_test", args.functions)
+functions = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(functions)
+
+# 1. START THE MOCK SERVER ###################################
+
+# Port 0 picks any free port, so this works even if Ollama is running
+server = start_server(port=0, profile=args.profile)
+host, port = server.server_address
+functions.CHAT_URL = f"http://{host}:{port}/api/chat"
+print(f"🧪 Mock Ollama on port {port} | profile: {args.profile} | helpers: {args.functions}")
+
+# A simple tool for the agent to call, when --tools is set
+def add_two_numbers(x, y):
+    return x + y
+
+tool_add_two_numbers = {
+    "type": "function",
+    "function": {
+        "name": "add_two_numbers",
+        "description": "Add two numbers",
+        "parameters": {
+            "type": "object",
+            "required": ["x", "y"],
+            "properties": {"x": {"type": "number"}, "y": {"type": "number"}},
+        },
+    },
+}
+
+# Register the tool in whichever way the helpers expect
+if hasattr(functions, "tool"):
+    functions.tool(add_two_numbers)
+else:
+    functions.add_two_numbers = add_two_numbers
+tools = [tool_add_two_numbers] if args.tools else None
+
+# 2. RUN THE LOAD TEST ###################################
+
+# Time one agent call
+def one_call(i):
+    start = time.perf_counter()
+    functions.agent_run(role="You are a helpful assistant.", task=f"Request {i}: add 3 + 5.", tools=tools)
+    return time.perf_counter() - start
+
+# Warm up once, so model load time is not counted in the results
+one_call(-1)
+
+start = time.perf_counter()
+with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+    latencies = sorted(pool.map(one_call, range(args.requests)))
+elapsed = time.perf_counter() - start
+
+# 3. REPORT ###################################
+
+p50 = statistics.median(latencies)
+p95 = latencies[int(0.95 * (len(latencies) - 1))]
+print(f"   requests: {args.requests} | concurrency: {args.concurrency} | tools: {bool(tools)}")
+print(f"   throughput: {args.requests / elapsed:.1f} requests/s")
+print(f"   latency p50: {p50 * 1000:.1f} ms | p95: {p95 * 1000:.1f} ms | max: {latencies[-1] * 1000:.1f} ms")
+
+server.shutdown()
@@ -11,6 +11,9 @@
 
 import requests  # for HTTP requests
 import json      # for working with JSON
+import os        # for reading environment variables
+import threading # for warming up models in the background
+import time      # for timing model loads
 import pandas as pd  # for data manipulation
 from datetime import datetime  # for date parsing
 
@@ -25,9 +28,77 @@ PORT = 11434
 OLLAMA_HOST = f"http://localhost:{PORT}"
 CHAT_URL = f"{OLLAMA_HOST}/api/chat"
 
+# How long Ollama keeps a model loaded in memory after each request (e.g. "30m"; -1 = forever).
+# Keeping the model resident avoids reloading it, and lets Ollama reuse the
+# already-processed prompt prefix (e.g. a long system prompt) on the next call.
+KEEP_ALIVE = "30m"
+
+GENERATE_URL = f"{OLLAMA_HOST}/api/generate"
+
+
+## 0.3 Model Warm-Up #################################
+
+def warmup(models, background=True, keep_alive=KEEP_ALIVE, verbose=True):
+    """
+    Load models into Ollama's memory before the first real request.
+
+    The first call to a model pays its load time (seconds for small models,
+    much longer for large ones). Sending an empty request loads the model
+    without generating anything, so later agent calls start right away.
+
+    Parameters:
+    -----------
+    models : str or list
+        Model name(s) to load, e.g. ["smollm2:1.7b"]
+    background : bool
+        If True (default), load in a background thread and return immediately
+    keep_alive : str or int
+        How long Ollama keeps each model loaded (default: KEEP_ALIVE)
+    verbose : bool
+        If True, print the load time of each model
+
+    Returns:
+    --------
+    dict
+        {"thread": thread or None, "load_seconds": {model: seconds}}.
+        load_seconds fills in as each model finishes loading (None on failure).
+    """
+
+    if isinstance(models, str):
+        models = [models]
+    report = {"thread": None, "load_seconds": {}}
+
+    def load_all():
+        for model in models:
+            start = time.perf_counter()
+            try:
+                # A generate request with no prompt just loads the model
+                response = requests.post(GENERATE_URL, json={"model": model, "keep_alive": keep_alive}, timeout=600)
+                response.raise_for_status()
+                seconds = time.perf_counter() - start
+                report["load_seconds"][model] = seconds
+                if verbose: print(f"🔥 Warmed up {model} in {seconds:.2f}s")
+            except requests.RequestException as e:
+                report["load_seconds"][model] = None
+                if verbose: print(f"⚠️ Could not warm up {model}: {e}")
+
+    if background:
+        report["thread"] = threading.Thread(target=load_all, daemon=True)
+        report["thread"].start()
+    else:
+        load_all()
+    return report
+
+
+# Optional: warm up models as soon as this module is imported, e.g.
+# OLLAMA_WARMUP="smollm2:1.7b,smollm2:135m" python 03_agents.py
+if os.getenv("OLLAMA_WARMUP"):
+    warmup([m.strip() for m in os.getenv("OLLAMA_WARMUP").split(",") if m.strip()])
+
+
 # 1. AGENT FUNCTION ###################################
 
-def agent(messages, model=DEFAULT_MODEL, output="text", tools=None, all=False):
+def agent(messages, model=DEFAULT_MODEL, output="text", tools=None, all=False, keep_alive=KEEP_ALIVE):
     """
     Agent wrapper function that runs a single agent, with or without tools.
     
@@ -44,6 +115,8 @@ def agent(messages, model=DEFAULT_MODEL, output="text", tools=None, all=False):
         List of tool metadata dictionaries for function calling
     all : bool
         If True, return all responses. If False, return only the last response.
+    keep_alive : str or int
+        How long Ollama keeps the model loaded after this call (default: KEEP_ALIVE)
     
     Returns:
     --------
@@ -56,7 +129,8 @@ def agent(messages, model=DEFAULT_MODEL, output="text", tools=None, all=False):
         body = {
             "model": model,
             "messages": messages,
-            "stream": False
+            "stream": False,
+            "keep_alive": keep_alive
         }
         
         response = requests.post(CHAT_URL, json=body)
@@ -70,7 +144,8 @@ def agent(messages, model=DEFAULT_MODEL, output="text", tools=None, all=False):
             "model": model,
             "messages": messages,
             "tools": tools,
-            "stream": False
+            "stream": False,
+            "keep_alive": keep_alive
         }
         
         response = requests.post(CHAT_URL, json=body)
@@ -84,7 +159,8 @@ def agent(messages, model=DEFAULT_MODEL, output="text", tools=None, all=False):
                 # Execute the tool function
                 # Note: Tool functions must be defined in the global scope
                 func_name = tool_call["function"]["name"]
-                func_args = json.loads(tool_call["function"]["arguments"])
+                raw_args = tool_call["function"]["arguments"]
+                func_args = raw_args if isinstance(raw_args, dict) else json.loads(raw_args)
                 
                 # Get the function from globals and execute it
                 func = globals().get(func_name)
@@ -125,6 +201,7 @@ def agent_run(role, task, tools=None, output="text", model=DEFAULT_MODEL):
     """
     
     # Define the messages to be sent to the agent
+    # The system prompt goes first: it is the stable part that Ollama can reuse between calls
     messages = [
         {"role": "system", "content": role},
         {"role": "user", "content": task}
@@ -135,6 +212,88 @@ def agent_run(role, task, tools=None, output="text", model=DEFAULT_MODEL):
     return resp
 
 
+class AgentSession:
+    """
+    An agent with a fixed system prompt that is reused across many tasks.
+
+    Every request starts with the same system message and uses the same model
+    options, and keep_alive keeps the model loaded between calls. Ollama can
+    then reuse the processed system prompt (its KV cache) instead of reading it
+    again, so repeated long instructions cost almost no prefill time.
+
+    Parameters:
+    -----------
+    role : str
+        The system prompt defining the agent's role (e.g. rules or QC criteria)
+    model : str
+        Model to use (default: DEFAULT_MODEL)
+    keep_alive : str or int
+        How long Ollama keeps the model loaded between calls (default: KEEP_ALIVE)
+    options : dict, optional
+        Ollama model options (e.g. {"num_ctx": 8192}). Keep these fixed:
+        changing num_ctx between calls forces Ollama to reload the model.
+    remember : bool
+        If True, keep earlier tasks and answers in the conversation, so each
+        call continues from the previous context. If False (default), each
+        task is answered independently after the shared system prompt.
+    """
+
+    def __init__(self, role, model=DEFAULT_MODEL, keep_alive=KEEP_ALIVE, options=None, remember=False):
+        self.role = role
+        self.model = model
+        self.keep_alive = keep_alive
+        self.options = options or {}
+        self.remember = remember
+        self.history = []
+        # One entry per call: how many prompt tokens were processed and how long it took
+        self.stats = []
+
+    def run(self, task, format=None):
+        """
+        Send a task to the agent and return its text response.
+
+        Parameters:
+        -----------
+        task : str
+            The user message/task for the agent
+        format : str, optional
+            Set to "json" to request JSON output
+
+        Returns:
+        --------
+        str
+            The agent's response
+        """
+
+        # Stable prefix first (system prompt, then any remembered turns), new task last
+        messages = [{"role": "system", "content": self.role}] + self.history + [{"role": "user", "content": task}]
+        body = {"model": self.model, "messages": messages, "stream": False, "keep_alive": self.keep_alive}
+        if self.options:
+            body["options"] = self.options
+        if format is not None:
+            body["format"] = format
+
+        response = requests.post(CHAT_URL, json=body)
+        response.raise_for_status()
+        result = response.json()
+        content = result["message"]["content"]
+
+        # Ollama reports durations in nanoseconds; prompt_eval_* drops when the prefix is reused
+        self.stats.append({
+            "prompt_tokens": result.get("prompt_eval_count", 0),
+            "prefill_ms": result.get("prompt_eval_duration", 0) / 1e6,
+            "load_ms": result.get("load_duration", 0) / 1e6,
+        })
+
+        if self.remember:
+            self.history += [{"role": "user", "content": task}, {"role": "assistant", "content": content}]
+        return content
+
+    def reset(self):
+        """Forget remembered turns but keep the same system prompt."""
+        self.history = []
+
+
 # 2. DATA CONVERSION FUNCTION ###################################
 
 def df_as_text(df):
@@ -0,0 +1,307 @@
+# mock_ollama.py
+# Mock Ollama Server for Load Testing
+# Pairs with 05_load_test.py
+# Tim Fraser
+
+# This script runs a small stand-in for the Ollama HTTP API (/api/chat and /api/generate),
+# including streaming and tool calls, with canned responses and configurable latency.
+# It lets us test and benchmark agent code on a laptop with no model installed,
+# and shows how much time our own client code takes once model latency is removed.
+
+# Run it in place of Ollama (stop Ollama first, or pick another port):
+# python mock_ollama.py --profile small
+# python mock_ollama.py --port 11500 --profile instant --responses my_responses.json
+
+# 0. SETUP ###################################
+
+## 0.1 Load Packages #################################
+
+import argparse  # for command line options
+import json      # for working with JSON
+import random    # for seeded latency jitter
+import threading # for running the server in the background
+import time      # for simulating latency
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Only the Python standard library is needed, so no pip install is required.
+
+## 0.2 Latency Profiles #################################
+
+# Each profile imitates a model size:
+# - load_ms: one-off load time the first time a model is requested
+# - prefill_ms: time before the first token (reading the prompt)
+# - tokens_per_sec: generation speed (None = no delay)
+# - jitter: +/- fraction of random variation, drawn from a seeded generator
+PROFILES = {
+    "instant": {"load_ms": 0, "prefill_ms": 0, "tokens_per_sec": None, "jitter": 0.0},
+    "small": {"load_ms": 1500, "prefill_ms": 40, "tokens_per_sec": 60, "jitter": 0.1},
+    "large": {"load_ms": 8000, "prefill_ms": 400, "tokens_per_sec": 15, "jitter": 0.1},
+}
+
+# Default canned answers
+DEFAULT_TEXT = "This is a canned response from the mock Ollama server."
+DEFAULT_JSON = {"response": "mock"}
+
+# Example values used to fill in tool call arguments, by JSON schema type
+EXAMPLE_VALUES = {"integer": 1, "number": 1.0, "string": "test", "boolean": True, "array": [], "object": {}}
+
+
+# 1. RESPONSE HELPERS ###################################
+
+def count_tokens(text):
+    """Rough token count (one token per word), good enough for usage statistics."""
+    return len(str(text).split())
+
+
+def example_tool_call(tools):
+    """Build a tool call for the first tool, filling required arguments with example values."""
+    function = tools[0]["function"]
+    properties = function.get("parameters", {}).get("properties", {})
+    required = function.get("parameters", {}).get("required", list(properties))
+    arguments = {name: EXAMPLE_VALUES.get(properties.get(name, {}).get("type"), "test") for name in required}
+    return [{"function": {"name": function["name"], "arguments": arguments}}]
+
+
+class MockModel:
+    """
+    Decides what the mock server answers and how long it takes.
+
+    Parameters:
+    -----------
+    profile : str
+        Name of a latency profile in PROFILES
+    responses : list, optional
+        Canned responses: [{"match": "substring", "content": "...", "tool_calls": [...]}, ...].
+        The first entry whose 'match' appears in the last user message is used.
+    seed : int
+        Seed for latency jitter, so runs are repeatable
+    """
+
+    def __init__(self, profile="instant", responses=None, seed=42):
+        self.profile = PROFILES[profile]
+        self.responses = responses or []
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.loaded = set()
+        self.request_count = 0
+
+    def delay(self, ms):
+        """Sleep for ms milliseconds, plus or minus the profile's jitter."""
+        if ms <= 0:
+            return 0
+        with self.lock:
+            factor = 1 + self.random.uniform(-self.profile["jitter"], self.profile["jitter"])
+        seconds = ms * factor / 1000
+        time.sleep(seconds)
+        return seconds
+
+    def load(self, model):
+        """Simulate loading a model the first time it is used. Returns seconds spent."""
+        with self.lock:
+            self.request_count += 1
+            first_time = model not in self.loaded
+            self.loaded.add(model)
+        return self.delay(self.profile["load_ms"]) if first_time else 0
+
+    def seconds_per_token(self):
+        rate = self.profile["tokens_per_sec"]
+        return 1 / rate if rate else 0
+
+    def reply(self, messages, tools=None, format=None):
+        """Return (content, tool_calls) for a chat request."""
+        last = messages[-1] if messages else {}
+        last_user = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+
+        # Use the first canned response that matches the user's message
+        for entry in self.responses:
+            if entry.get("match", "") in str(last_user):
+                if entry.get("tool_calls") and tools and last.get("role") != "tool":
+                    return "", entry["tool_calls"]
+                if "content" in entry:
+                    return entry["content"], None
+
+        # With tools: call a tool first, then answer once a tool result comes back
+        if tools and last.get("role") != "tool":
+            return "", example_tool_call(tools)
+        if last.get("role") == "tool":
+            return f"The tool returned: {last.get('content', '')}", None
+        if format == "json":
+            return json.dumps(DEFAULT_JSON), None
+        return DEFAULT_TEXT, None
+
+
+# 2. HTTP HANDLER ###################################
+
+class MockOllamaHandler(BaseHTTPRequestHandler):
+    """Handles Ollama API requests using the server's MockModel."""
+
+    # HTTP/1.1 lets clients reuse connections (keep-alive), like the real server
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        # Stay quiet: printing every request would slow down load tests
+        pass
+
+    def send_json(self, data, status=200):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            models = [{"name": name} for name in sorted(self.server.mock.loaded)]
+            self.send_json({"models": models})
+        elif self.path == "/api/version":
+            self.send_json({"version": "mock"})
+        else:
+            self.send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self.send_json({"error": "invalid JSON body"}, status=400)
+            return
+
+        if self.path == "/api/chat":
+            self.handle_chat(body)
+        elif self.path == "/api/generate":
+            self.handle_generate(body)
+        else:
+            self.send_json({"error": "not found"}, status=404)
+
+    def handle_chat(self, body):
+        messages = body.get("messages", [])
+        content, tool_calls = self.server.mock.reply(messages, tools=body.get("tools"), format=body.get("format"))
+        prompt_tokens = sum(count_tokens(m.get("content", "")) for m in messages)
+        self.respond(body, content, tool_calls, prompt_tokens, key="message")
+
+    def handle_generate(self, body):
+        prompt = body.get("prompt", "")
+        # Like Ollama, a request without a prompt only loads the model
+        if not prompt:
+            load_seconds = self.server.mock.load(body.get("model", ""))
+            self.send_json({
+                "model": body.get("model", ""), "response": "", "done": True, "done_reason": "load",
+                "load_duration": int(load_seconds * 1e9),
+            })
+            return
+        messages = [{"role": "user", "content": prompt}]
+        content, _ = self.server.mock.reply(messages, format=body.get("format"))
+        self.respond(body, content, None, count_tokens(prompt), key="response")
+
+    def respond(self, body, content, tool_calls, prompt_tokens, key):
+        """Simulate load, prefill and generation time, then send a normal or streamed reply."""
+        mock = self.server.mock
+        model = body.get("model", "")
+        load_seconds = mock.load(model)
+        prefill_seconds = mock.delay(mock.profile["prefill_ms"])
+        words = content.split(" ") if content else []
+        stream = body.get("stream", True)  # Ollama streams unless told otherwise
+
+        def chunk(text, done, eval_seconds=0.0):
+            data = {"model": model, "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), "done": done}
+            if key == "message":
+                data["message"] = {"role": "assistant", "content": text}
+                if done and tool_calls:
+                    data["message"]["tool_calls"] = tool_calls
+            else:
+                data["response"] = text
+            if done:
+                data.update({
+                    "done_reason": "stop",
+                    "load_duration": int(load_seconds * 1e9),
+                    "prompt_eval_count": prompt_tokens,
+                    "prompt_eval_duration": int(prefill_seconds * 1e9),
+                    "eval_count": len(words),
+                    "eval_duration": int(eval_seconds * 1e9),
+                    "total_duration": int((load_seconds + prefill_seconds + eval_seconds) * 1e9),
+                })
+            return data
+
+        if not stream:
+            eval_seconds = mock.delay(len(words) * mock.seconds_per_token() * 1000)
+            self.send_json(chunk(content, True, eval_seconds))
+            return
+
+        # Streaming: one JSON object per line (NDJSON), one word at a time
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        eval_seconds = 0.0
+        for i, word in enumerate(words):
+            eval_seconds += mock.delay(mock.seconds_per_token() * 1000)
+            self.write_chunk(chunk(word if i == 0 else " " + word, False))
+        self.write_chunk(chunk("", True, eval_seconds))
+        self.wfile.write(b"0\r\n\r\n")
+
+    def write_chunk(self, data):
+        line = (json.dumps(data) + "\n").encode("utf-8")
+        self.wfile.write(f"{len(line):X}\r\n".encode("ascii") + line + b"\r\n")
+        self.wfile.flush()
+
+
+# 3. SERVER FUNCTIONS ###################################
+
+class MockOllamaServer(ThreadingHTTPServer):
+    """Threaded HTTP server: one thread per connection, like handling many clients at once."""
+
+    daemon_threads = True
+    # Allow many pending connections, so bursts of concurrent clients are not refused
+    request_queue_size = 256
+
+
+def start_server(host="127.0.0.1", port=11434, profile="instant", responses=None, seed=42, background=True):
+    """
+    Start the mock Ollama server.
+
+    Parameters:
+    -----------
+    host, port : str, int
+        Address to listen on. Use port=0 to pick any free port.
+    profile : str
+        Latency profile name (see PROFILES)
+    responses : list, optional
+        Canned responses (see MockModel)
+    seed : int
+        Seed for latency jitter
+    background : bool
+        If True, serve from a background thread and return right away
+
+    Returns:
+    --------
+    MockOllamaServer
+        The running server; server.server_address gives the actual (host, port)
+    """
+    server = MockOllamaServer((host, port), MockOllamaHandler)
+    server.mock = MockModel(profile=profile, responses=responses, seed=seed)
+    if background:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    else:
+        server.serve_forever()
+    return server
+
+
+# 4. RUN FROM COMMAND LINE ###################################
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock Ollama server for load testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--profile", default="instant", choices=sorted(PROFILES))
+    parser.add_argument("--responses", help="JSON file with a list of canned responses")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    responses = None
+    if args.responses:
+        with open(args.responses, "r", encoding="utf-8") as f:
+            responses = json.load(f)
+
+    print(f"🧪 Mock Ollama listening on http://{args.host}:{args.port} (profile: {args.profile})")
+    start_server(args.host, args.port, args.profile, responses, args.seed, background=False)
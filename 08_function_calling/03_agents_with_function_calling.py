@@ -21,7 +21,7 @@ import pandas as pd  # for data manipulation
 ## 0.2 Load Functions #################################
 
 # Load helper functions for agent orchestration
-from functions import agent
+from functions import agent, agent_loop, tool, tool_metadata
 
 ## 0.3 Configuration #################################
 
@@ -31,11 +31,23 @@ MODEL = "smollm2:1.7b"
 # 1. DEFINE FUNCTIONS TO BE USED AS TOOLS ###################################
 
 # Define a function to be used as a tool
+# The @tool decorator registers it, so agent() can find and call it by name
+@tool
 def add_two_numbers(x, y):
-    """Add two numbers together."""
+    """
+    Add two numbers together.
+
+    Parameters:
+    -----------
+    x : float
+        first number
+    y : float
+        second number
+    """
     return x + y
 
 # Define another function to be used as a tool
+@tool(description="Convert a data.frame into a markdown table")
 def get_table(df):
     """
     Convert a pandas DataFrame into a markdown table.
@@ -43,7 +55,7 @@ def get_table(df):
     Parameters:
     -----------
     df : pandas.DataFrame
-        The DataFrame to convert to a markdown table
+        The data.frame to convert to a markdown table using pandas to_markdown()
     
     Returns:
     --------
@@ -68,47 +80,12 @@ def get_table(df):
 
 # 2. DEFINE TOOL METADATA ###################################
 
-# Define the tool metadata for add_two_numbers
-tool_add_two_numbers = {
-    "type": "function",
-    "function": {
-        "name": "add_two_numbers",
-        "description": "Add two numbers",
-        "parameters": {
-            "type": "object",
-            "required": ["x", "y"],
-            "properties": {
-                "x": {
-                    "type": "number",
-                    "description": "first number"
-                },
-                "y": {
-                    "type": "number",
-                    "description": "second number"
-                }
-            }
-        }
-    }
-}
-
-# Define the tool metadata for get_table
-tool_get_table = {
-    "type": "function",
-    "function": {
-        "name": "get_table",
-        "description": "Convert a data.frame into a markdown table",
-        "parameters": {
-            "type": "object",
-            "required": ["df"],
-            "properties": {
-                "df": {
-                    "type": "object",
-                    "description": "The data.frame to convert to a markdown table using pandas to_markdown()"
-                }
-            }
-        }
-    }
-}
+# The @tool decorator already built each tool's metadata from its signature
+# and docstring, so we no longer write these dictionaries by hand.
+# Print one to see what the model receives.
+tool_add_two_numbers = tool_metadata(add_two_numbers)
+tool_get_table = tool_metadata(get_table)
+print(json.dumps(tool_add_two_numbers, indent=2))
 
 # 3. EXAMPLE 1: STANDARD CHAT (NO TOOLS) ###################################
 
@@ -169,3 +146,19 @@ print(manual_table)
 print()
 
 # Note: We can use the agent() function to rapidly build and test out agents with or without tools.
+
+# 6. EXAMPLE 4: MULTI-TURN TOOL LOOP ###################################
+
+# Examples 2 and 3 chain two tools by hand: we read the output of tool #1
+# and paste it into a new prompt for tool #2.
+# agent_loop() sends each tool result back to the model as a 'tool' message,
+# so the model can decide on its own to call the next tool.
+messages = [
+    {"role": "user", "content": "Add 3 + 5, then place the result into a 1x1 data.frame with column name 'x' and format it as a markdown table."}
+]
+
+# max_steps caps the number of model requests, so a confused model cannot loop forever
+resp3 = agent_loop(messages=messages, model=MODEL, tools=[tool_add_two_numbers, tool_get_table], max_steps=4, all=True)
+print("Tool Loop Result:")
+print(resp3["content"])
+print(f"Steps: {resp3['steps']} | Tokens: {resp3['tokens']} | Tools executed: {resp3['tool_calls_executed']}")
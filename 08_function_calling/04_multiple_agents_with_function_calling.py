@@ -21,7 +21,7 @@ from datetime import datetime  # for date parsing
 ## 0.2 Load Functions #################################
 
 # Load helper functions for agent orchestration
-from functions import agent_run, df_as_text
+from functions import agent_run, df_as_text, tool
 
 ## 0.3 Configuration #################################
 
@@ -33,6 +33,8 @@ MODEL = "smollm2:1.7b"
 
 # 1. DEFINE API FUNCTION AS A TOOL ###################################
 
+# Register the function with @tool so agent_run() can call it by name
+@tool
 def get_shortages(category="Psychiatry", limit=500):
     """
     Get data on drug shortages from the FDA Drug Shortages API.
@@ -103,6 +105,7 @@ categories = [
 ]
 
 # Define the tool metadata as a dictionary
+# We write this one by hand (instead of using tool_metadata()) to list the category options
 tool_get_shortages = {
     "type": "function",
     "function": {
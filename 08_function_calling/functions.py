@@ -9,7 +9,8 @@
 
 ## 0.1 Load Packages #################################
 
-import sys  # for resolving tool functions in the caller's __main__
+import inspect  # for reading tool function signatures
+import re  # for parsing tool docstrings
 import requests  # for HTTP requests
 import json      # for working with JSON
 import pandas as pd  # for data manipulation
@@ -26,15 +27,198 @@ OLLAMA_HOST = f"http://localhost:{PORT}"
 CHAT_URL = f"{OLLAMA_HOST}/api/chat"
 
 
-def _resolve_tool_function(name):
-    """Look up a tool by name in this module, then in the running script (__main__)."""
-    func = globals().get(name)
-    if func is not None:
-        return func
-    main = sys.modules.get("__main__")
-    if main is not None:
-        return getattr(main, name, None)
-    return None
+## 0.3 Tool Registry #################################
+
+# Tools are registered once with the @tool decorator.
+# Registration builds the JSON schema the model needs from the function's
+# signature and docstring, and prepares one argument converter per parameter,
+# so each tool call is just a dictionary lookup plus a few conversions.
+TOOL_REGISTRY = {}
+
+# Map Python type names (from annotations or docstrings) to JSON schema types
+JSON_TYPES = {
+    "int": "integer", "integer": "integer",
+    "float": "number", "number": "number",
+    "str": "string", "string": "string",
+    "bool": "boolean", "boolean": "boolean",
+    "list": "array", "tuple": "array", "array": "array",
+    "dict": "object", "object": "object", "pandas.DataFrame": "object", "DataFrame": "object",
+}
+
+
+def _parse_docstring(doc):
+    """Split a numpy-style docstring into a one-line summary and {param: (type, description)}."""
+    lines = inspect.cleandoc(doc or "").splitlines()
+    summary = lines[0].strip() if lines else ""
+    params = {}
+    in_params = False
+    current = None
+    for line in lines[1:]:
+        stripped = line.strip()
+        if stripped.startswith("Parameters"):
+            in_params = True
+            continue
+        if not in_params or set(stripped) <= {"-"}:
+            continue
+        # A new un-indented section (e.g. "Returns:") ends the parameter list
+        if not line.startswith(" ") and ":" not in stripped.rstrip(":"):
+            break
+        match = re.match(r"^(\w+)\s*:\s*(.+)$", stripped)
+        if match and not line.startswith(" "):
+            current = match.group(1)
+            params[current] = (match.group(2).split()[0].strip(","), "")
+        elif current is not None:
+            type_name, desc = params[current]
+            params[current] = (type_name, f"{desc} {stripped}".strip())
+    return summary, params
+
+
+def _make_converter(json_type):
+    """Build a function that coerces one argument from the model into the expected type."""
+    def parse_text(value):
+        # Models sometimes send lists/objects as JSON strings, e.g. "[1, 2]"
+        return json.loads(value) if isinstance(value, str) else value
+
+    def to_integer(value):
+        # Accept 3, 3.0 or "3", but reject 3.7 instead of silently truncating it
+        number = float(value)
+        if not number.is_integer():
+            raise ValueError(f"expected an integer, got {value!r}")
+        return int(number)
+
+    if json_type == "integer":
+        return to_integer
+    if json_type == "number":
+        return float
+    if json_type == "string":
+        return str
+    if json_type == "boolean":
+        return lambda value: value.strip().lower() in ("true", "1", "yes") if isinstance(value, str) else bool(value)
+    if json_type == "array":
+        return lambda value: list(parse_text(value))
+    return parse_text
+
+
+def tool(func=None, *, name=None, description=None):
+    """
+    Register a function as a tool the agent can call.
+
+    Use as @tool or @tool(description="..."). The tool metadata is built from
+    the function signature and its numpy-style docstring, and is available as
+    tool_metadata(func) to pass in an agent's tools list.
+
+    Parameters:
+    -----------
+    func : callable
+        The function to register
+    name : str, optional
+        Tool name shown to the model (default: the function's name)
+    description : str, optional
+        Tool description (default: first line of the docstring)
+
+    Returns:
+    --------
+    callable
+        The same function, unchanged, so it can still be called directly
+    """
+
+    def register(f):
+        tool_name = name or f.__name__
+        summary, doc_params = _parse_docstring(f.__doc__)
+        properties = {}
+        required = []
+        converters = {}
+        var_kinds = (inspect.Parameter.VAR_POSITIONAL, inspect.Parameter.VAR_KEYWORD)
+        parameters = inspect.signature(f).parameters.values()
+        for param in parameters:
+            # *args/**kwargs are not named arguments the model can fill in
+            if param.kind in var_kinds:
+                continue
+            # Prefer the type annotation; otherwise use the type written in the docstring
+            if param.annotation is not inspect.Parameter.empty:
+                type_name = getattr(param.annotation, "__name__", str(param.annotation))
+            else:
+                type_name = doc_params.get(param.name, ("string", ""))[0]
+            json_type = JSON_TYPES.get(type_name, "string")
+            properties[param.name] = {"type": json_type, "description": doc_params.get(param.name, ("", ""))[1]}
+            converters[param.name] = _make_converter(json_type)
+            if param.default is inspect.Parameter.empty:
+                required.append(param.name)
+
+        TOOL_REGISTRY[tool_name] = {
+            "function": f,
+            "converters": converters,
+            "required": required,
+            # With **kwargs, arguments not in the signature are passed on unchanged
+            "accepts_kwargs": any(p.kind is inspect.Parameter.VAR_KEYWORD for p in parameters),
+            "metadata": {
+                "type": "function",
+                "function": {
+                    "name": tool_name,
+                    "description": description or summary,
+                    "parameters": {"type": "object", "required": required, "properties": properties},
+                },
+            },
+        }
+        return f
+
+    # Support both @tool and @tool(...)
+    return register(func) if func is not None else register
+
+
+def tool_metadata(func):
+    """Return the tool metadata dictionary for a registered function (or tool name)."""
+    tool_name = func if isinstance(func, str) else func.__name__
+    return TOOL_REGISTRY[tool_name]["metadata"]
+
+
+def call_tool(name, arguments):
+    """
+    Validate the model's arguments and run a registered tool.
+
+    Returns an {"error": ...} dictionary instead of raising, so the problem can
+    be reported back to the model.
+    """
+    entry = TOOL_REGISTRY.get(name)
+    if entry is None:
+        return {"error": f"unknown tool: {name}"}
+
+    # Models sometimes send the arguments as a JSON string, which may be malformed
+    try:
+        args = arguments if isinstance(arguments, dict) else json.loads(arguments or "{}")
+    except ValueError as e:
+        return {"error": f"arguments for {name} are not valid JSON: {e}"}
+    if not isinstance(args, dict):
+        return {"error": f"arguments for {name} must be a JSON object"}
+    missing = [param for param in entry["required"] if param not in args]
+    if missing:
+        return {"error": f"missing required arguments for {name}: {', '.join(missing)}"}
+
+    # A JSON null for an optional argument means "use the default"
+    args = {key: value for key, value in args.items() if value is not None or key in entry["required"]}
+
+    # Convert each known argument (null passes through as None); ignore extra
+    # arguments the function does not accept
+    converters = entry["converters"]
+    try:
+        clean_args = {
+            key: converters[key](value) if key in converters and value is not None else value
+            for key, value in args.items()
+            if key in converters or entry["accepts_kwargs"]
+        }
+    except (TypeError, ValueError, OverflowError) as e:
+        return {"error": f"invalid arguments for {name}: {e}"}
+
+    # A tool that fails is reported back to the model, not raised into the agent loop
+    try:
+        return entry["function"](**clean_args)
+    except Exception as e:
+        return {"error": f"{name} failed: {e}"}
+
+
+def _tools_as_metadata(tools):
+    """Allow a tools list to mix metadata dictionaries and @tool-registered functions."""
+    return [tool_metadata(t) if callable(t) else t for t in tools]
 
 
 # 1. AGENT FUNCTION ###################################
@@ -53,7 +237,7 @@ def agent(messages, model=DEFAULT_MODEL, output="text", tools=None, all=False):
     output : str
         The output format (default: "text")
     tools : list, optional
-        List of tool metadata dictionaries for function calling
+        List of tool metadata dictionaries, or functions registered with @tool
     all : bool
         If True, return all responses. If False, return only the last response.
     
@@ -81,7 +265,7 @@ def agent(messages, model=DEFAULT_MODEL, output="text", tools=None, all=False):
         body = {
             "model": model,
             "messages": messages,
-            "tools": tools,
+            "tools": _tools_as_metadata(tools),
             "stream": False
         }
         
@@ -94,16 +278,9 @@ def agent(messages, model=DEFAULT_MODEL, output="text", tools=None, all=False):
             tool_calls = result["message"]["tool_calls"]
             for tool_call in tool_calls:
                 # Execute the tool function
-                # Note: Tool functions must be defined in the global scope
+                # Note: Tool functions must be registered with the @tool decorator
                 func_name = tool_call["function"]["name"]
-                raw_args = tool_call["function"]["arguments"]
-                func_args = raw_args if isinstance(raw_args, dict) else json.loads(raw_args)
-                
-                # Get the function from globals or __main__ and execute it
-                func = _resolve_tool_function(func_name)
-                if func:
-                    output = func(**func_args)
-                    tool_call["output"] = output
+                tool_call["output"] = call_tool(func_name, tool_call["function"]["arguments"])
         
         if all:
             return result
@@ -152,6 +329,126 @@ def agent_run(role, task, tools=None, output="text", model=DEFAULT_MODEL):
     return resp
 
 
+## 1.1 Multi-Turn Agent Loop #################################
+
+def _tool_output_as_text(output):
+    """Convert a tool's return value into text the model can read in a 'tool' message."""
+    if isinstance(output, str):
+        return output
+    if isinstance(output, pd.DataFrame):
+        return df_as_text(output)
+    return json.dumps(output, default=str)
+
+
+def agent_loop(messages, model=DEFAULT_MODEL, tools=None, max_steps=5, max_tokens=None, all=False):
+    """
+    Run an agent that keeps calling tools until it can answer in plain text.
+
+    Each round, the model's tool calls are executed and their results are sent
+    back as 'tool' messages, so the model can chain several tools by itself.
+    Identical tool calls (same name and arguments) are only executed once per loop.
+
+    Parameters:
+    -----------
+    messages : list
+        List of message dictionaries with 'role' and 'content' keys.
+    model : str
+        The model to be used for the agent (default: "smollm2:1.7b")
+    tools : list, optional
+        List of tool metadata dictionaries, or functions registered with @tool
+    max_steps : int
+        Maximum number of requests sent to the model with tools (default: 5)
+    max_tokens : int, optional
+        Stop once prompt + generated tokens across all steps exceed this budget.
+        If either limit ends the loop after a tool call, one last request
+        without tools asks the model to answer from the results so far.
+    all : bool
+        If True, return a dictionary with the full message history and usage stats.
+        If False, return only the final text answer.
+
+    Returns:
+    --------
+    str or dict
+        The agent's final answer, or the full transcript when all=True
+    """
+
+    # Copy the messages so the caller's list is not modified
+    history = list(messages)
+    cache = {}
+    tokens_used = 0
+    steps = 0
+    content = ""
+    stop_reason = "max_steps"
+
+    while steps < max_steps:
+        body = {"model": model, "messages": history, "stream": False}
+        if tools:
+            body["tools"] = _tools_as_metadata(tools)
+
+        response = requests.post(CHAT_URL, json=body)
+        response.raise_for_status()
+        result = response.json()
+        steps += 1
+
+        # Track token usage reported by Ollama (prompt tokens + generated tokens)
+        tokens_used += result.get("prompt_eval_count", 0) + result.get("eval_count", 0)
+
+        message = result.get("message", {})
+        history.append(message)
+        content = message.get("content", "")
+        tool_calls = message.get("tool_calls") or []
+
+        # No more tool calls means the model has produced its final answer
+        if not tool_calls:
+            stop_reason = "done"
+            break
+
+        # Execute each tool call and send the result back as a 'tool' message
+        for tool_call in tool_calls:
+            func_name = tool_call["function"]["name"]
+            raw_args = tool_call["function"]["arguments"]
+
+            # Reuse the result of an identical call made earlier in this loop.
+            # call_tool() parses string arguments itself and reports malformed JSON as an error.
+            try:
+                func_args = raw_args if isinstance(raw_args, dict) else json.loads(raw_args or "{}")
+                key = (func_name, json.dumps(func_args, sort_keys=True, default=str))
+            except ValueError:
+                key = (func_name, str(raw_args))
+            if key not in cache:
+                cache[key] = call_tool(func_name, raw_args)
+            history.append({"role": "tool", "tool_name": func_name, "content": _tool_output_as_text(cache[key])})
+
+        # Stop early if the token budget is spent
+        if max_tokens is not None and tokens_used >= max_tokens:
+            stop_reason = "max_tokens"
+            break
+
+    if stop_reason != "done":
+        print(f"⚠️ agent_loop stopped before a final answer ({stop_reason}: {steps} steps, {tokens_used} tokens)")
+        # The last turn only called tools, so ask once more without tools for an
+        # answer based on the results so far; fall back to the last tool output.
+        response = requests.post(CHAT_URL, json={"model": model, "messages": history, "stream": False})
+        response.raise_for_status()
+        result = response.json()
+        steps += 1
+        tokens_used += result.get("prompt_eval_count", 0) + result.get("eval_count", 0)
+        message = result.get("message", {})
+        history.append(message)
+        content = message.get("content", "") or history[-2].get("content", "")
+
+    if all:
+        return {
+            "content": content,
+            "messages": history,
+            "steps": steps,
+            "tokens": tokens_used,
+            "tool_calls_executed": len(cache),
+            "stop_reason": stop_reason,
+        }
+    return content
+
+
 # 2. DATA CONVERSION FUNCTION ###################################
 
 def df_as_text(df):
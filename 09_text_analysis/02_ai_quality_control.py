@@ -30,6 +30,9 @@ AI_PROVIDER = "ollama"  # Change to "openai" if using OpenAI
 PORT = 11434
 OLLAMA_HOST = f"http://localhost:{PORT}"
 OLLAMA_MODEL = "llama3.2:latest"  # Use a model that supports JSON output
+# Keep the model loaded between calls, so repeated QC requests skip model loading
+# and Ollama can reuse the (identical) QC instructions it already processed
+OLLAMA_KEEP_ALIVE = "30m"
 
 # OpenAI configuration
 load_dotenv()
@@ -67,10 +70,13 @@ print("---\n")
 ## 1.1 Create Quality Control Prompt #################################
 
 # Create a comprehensive quality control prompt based on samplevalidation.tex
-# This prompt asks the AI to evaluate text on multiple criteria
+# This prompt asks the AI to evaluate text on multiple criteria.
+# It returns chat messages: the long, unchanging instructions go first in the
+# system message, and only the report text (which changes every call) goes last.
+# When checking many reports, the AI provider can then reuse the shared prefix.
 def create_quality_control_prompt(report_text, source_data=None):
     # Base instructions for quality control
-    instructions = "You are a quality control validator for AI-generated reports. Evaluate the following report text on multiple criteria and return your assessment as valid JSON."
+    instructions = "You are a quality control validator for AI-generated reports. Evaluate the report text provided by the user on multiple criteria and return your assessment as valid JSON."
     
     # Add source data if provided for accuracy checking
     data_context = ""
@@ -109,29 +115,30 @@ Return your response as valid JSON in this exact format:
 }
 """
     
-    # Combine into full prompt
-    full_prompt = f"{instructions}{data_context}\n\nReport Text to Validate:\n{report_text}{criteria}"
+    # Stable prefix (instructions, source data, criteria) first; report text last
+    system_prompt = f"{instructions}{data_context}{criteria}"
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": f"Report Text to Validate:\n{report_text}"}
+    ]
     
-    return full_prompt
+    return messages
 
 ## 1.2 Query AI Function #################################
 
 # Function to query AI and get quality control results
-def query_ai_quality_control(prompt, provider=AI_PROVIDER):
+# 'messages' is the list returned by create_quality_control_prompt()
+def query_ai_quality_control(messages, provider=AI_PROVIDER):
     if provider == "ollama":
         # Query Ollama
         url = f"{OLLAMA_HOST}/api/chat"
         
         body = {
             "model": OLLAMA_MODEL,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
+            "messages": messages,
             "format": "json",  # Request JSON output
-            "stream": False
+            "stream": False,
+            "keep_alive": OLLAMA_KEEP_ALIVE  # Keep the model (and cached prompt prefix) loaded
         }
         
         response = requests.post(url, json=body)
@@ -148,16 +155,7 @@ def query_ai_quality_control(prompt, provider=AI_PROVIDER):
         
         body = {
             "model": OPENAI_MODEL,
-            "messages": [
-                {
-                    "role": "system",
-                    "content": "You are a quality control validator. Always return your responses as valid JSON."
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
+            "messages": messages,
             "response_format": {"type": "json_object"},  # Request JSON output
             "temperature": 0.3  # Lower temperature for more consistent validation
         }
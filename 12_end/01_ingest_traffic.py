@@ -5,22 +5,60 @@
 #
 # This cron-friendly script fetches the latest traverse-level vehicle counts from
 # the Brussels traffic API and stores normalized rows in SQLite.
+# With --daemon it instead runs as a long-lived service that ingests once per minute,
+# reusing HTTP sessions between ticks while a background thread writes to SQLite.
+# Rows are always appended to a local spool (data/spool/) before they reach
+# traffic.db, so a locked database delays a minute of data instead of losing it.
+# With --backfill it fills gaps from past downtime using the API's history request.
+# With --sources it ingests several sources, intervals (1m, 15m, 60m), time slices
+# and lanes at once: jobs are fetched concurrently and written by one writer.
 
 # Run from inside the 12_end/ directory so the paths resolve correctly.
 # Git bash: cd 12_end && python 01_ingest_traffic.py
 # Powershell: Set-Location 12_end; python 01_ingest_traffic.py
+# Daemon mode: python 01_ingest_traffic.py --daemon
+# Several sources/intervals: python 01_ingest_traffic.py --sources sources.example.json
+# Flush rows left in the spool (e.g. after the DB was locked): python 01_ingest_traffic.py --flush
+# Backfill: python 01_ingest_traffic.py --backfill 2026-05-01 2026-05-31 --traverses CIN_TD2,LOI_103
+# Compact closed months into read-only partitions: python 01_ingest_traffic.py --compact
+# Recompute hourly/daily rollups from raw rows: python 01_ingest_traffic.py --rebuild-rollups
+# Archive sealed months to Parquet (needs pyarrow): python 01_ingest_traffic.py --archive
 
 # 0. SETUP ###################################
 
 ## 0.1 Load Packages #################################
 
+import argparse
+import itertools
+import json
 import sqlite3
+import threading
 import time
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime, timedelta, timezone
 from pathlib import Path
 from zoneinfo import ZoneInfo
 
 import requests
+import urllib3  # installed with requests; raises the errors seen while streaming a body
+
+# Optional: ijson parses the live payload as a stream, one monitor at a time,
+# instead of building the whole JSON document in memory (pip install ijson).
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# Shared helpers for the time-partitioned layout of traffic.db (see functions.py)
+from functions import (
+    RowSpool,
+    archive_partitions,
+    compact_partitions,
+    ensure_partitioned_layout,
+    ensure_rollups,
+    insert_traffic_rows,
+    rebuild_rollups,
+)
 
 
 # 1. CONFIG ###################################
@@ -32,20 +70,67 @@ BRUSSELS_METRO_ID = 948
 SCRIPT_DIR = Path(__file__).resolve().parent
 DATA_DIR = SCRIPT_DIR / "data"
 DB_PATH = DATA_DIR / "traffic.db"
+ARCHIVE_DIR = DATA_DIR / "archive"
+SPOOL_DIR = DATA_DIR / "spool"
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 
-print("\n====================================================")
-print("01_ingest_traffic.py | Brussels realtime ingest")
-print("====================================================")
-print(f"   metro_id: {BRUSSELS_METRO_ID}")
-print(f"   api: {BASE_URL}")
+# Daemon schedule: one tick per minute, a few seconds after the minute boundary
+# so the API has published the minute that just ended.
+TICK_SECONDS = 60
+TICK_OFFSET_SECONDS = 5
+
+# Backfill: how many history requests may be in flight at once.
+# Keep this small to stay polite to the public API.
+BACKFILL_WORKERS = 4
+
+# Live sources. Each (source, interval) pair is one API request per run.
+# - intervals: result intervals in minutes (the API offers 1, 15 and 60)
+# - all_slices: keep every time slice (t1, t2, ...) instead of only t1
+# - include_lanes: also keep per-lane counts (includeLanes=true)
+# The default reproduces the original 1m/t1 ingest; pass --sources FILE to
+# change it (see sources.example.json).
+DEFAULT_SOURCES = [
+    {
+        "name": "brussels",
+        "metro_id": BRUSSELS_METRO_ID,
+        "base_url": BASE_URL,
+        "intervals": [1],
+        "all_slices": False,
+        "include_lanes": False,
+    }
+]
+# How many live requests may be in flight at once
+FETCH_WORKERS = 4
+
+# New rows are appended to the spool first, then flushed into traffic.db.
+# The daemon flushes every FLUSH_SECONDS; a flush retries while the DB is locked.
+FLUSH_SECONDS = 15
+FLUSH_ATTEMPTS = 5
+
+# Everything that is not a 1m/t1 traverse total (other intervals, slices, lanes)
+# goes to traffic_detail, so the traffic table the model trains on is unchanged.
+DETAIL_INSERT_SQL = """
+    INSERT INTO traffic_detail
+      (metro_id, monitor_id, interval_minutes, time_slice, lane, observed_at, vehicles, speed, occupancy)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(metro_id, monitor_id, interval_minutes, time_slice, lane, observed_at) DO NOTHING
+"""
 
 
-def get_with_retry(url: str, params: dict, max_attempts: int = 5, timeout: int = 30) -> requests.Response:
+def get_with_retry(
+    url: str,
+    params: dict,
+    max_attempts: int = 5,
+    timeout: int = 30,
+    session: requests.Session | None = None,
+    stream: bool = False,
+) -> requests.Response:
     """Fetch API payload with retry/backoff for transient failures."""
+    http = session or requests
     for attempt in range(1, max_attempts + 1):
-        response = requests.get(url, params=params, timeout=timeout)
+        response = http.get(url, params=params, timeout=timeout, stream=stream)
         if response.status_code in {429, 500, 502, 503, 504} and attempt < max_attempts:
+            response.close()
             retry_after = response.headers.get("Retry-After")
             sleep_seconds = int(retry_after) if retry_after and retry_after.isdigit() else min(2 ** attempt, 30)
             print(
@@ -59,128 +144,729 @@ def get_with_retry(url: str, params: dict, max_attempts: int = 5, timeout: int =
     raise RuntimeError("Failed to fetch traffic payload after retries.")
 
 
-def parse_bxl_time_to_utc(end_time: str) -> str | None:
-    """Convert Brussels-local timestamp to UTC string format used in SQLite."""
-    if not end_time:
+# Time zones are built once; ZoneInfo lookups are not free when done per row.
+BRUSSELS_TZ = ZoneInfo("Europe/Brussels")
+
+# Memo of end_time string -> UTC string. Every monitor in a live payload shares
+# the same few end_time values, so almost every row is a dictionary lookup.
+# Cleared when it grows past _UTC_CACHE_MAX so a long-running daemon stays small.
+_UTC_CACHE: dict[str, str | None] = {}
+_UTC_CACHE_MAX = 50_000
+
+
+def _parse_local_minute(end_time: str) -> datetime | None:
+    """Parse "YYYY-MM-DD HH:MM" or "YYYY/MM/DD HH:MM" by slicing (much faster than strptime)."""
+    if len(end_time) != 16 or end_time[4] != end_time[7] or end_time[4] not in "-/" or end_time[10] != " ":
         return None
-    for fmt in ("%Y-%m-%d %H:%M", "%Y/%m/%d %H:%M"):
-        try:
-            local_dt = datetime.strptime(end_time, fmt).replace(tzinfo=ZoneInfo("Europe/Brussels"))
-            utc_dt = local_dt.astimezone(ZoneInfo("UTC"))
-            return utc_dt.strftime("%Y-%m-%d %H:%M:%S")
-        except (TypeError, ValueError):
+    try:
+        return datetime(
+            int(end_time[0:4]), int(end_time[5:7]), int(end_time[8:10]), int(end_time[11:13]), int(end_time[14:16])
+        )
+    except ValueError:
+        return None
+
+
+def _local_to_utc_candidates(naive: datetime) -> list[datetime]:
+    """
+    Return the UTC instant(s) a Brussels wall-clock time can mean.
+
+    - Normal times: one instant.
+    - Autumn fall-back hour (e.g. 02:30 happens twice): two instants, earliest first.
+    - Spring-forward gap (02:00-02:59 never happen): none. 02:00 is rejected too;
+      kept, it would map to the same UTC instant as 03:00 and overwrite that minute.
+    """
+    first = naive.replace(tzinfo=BRUSSELS_TZ, fold=0).astimezone(timezone.utc)
+    second = naive.replace(tzinfo=BRUSSELS_TZ, fold=1).astimezone(timezone.utc)
+    if first == second:
+        return [first]
+    # In the gap, converting back does not give the same wall-clock time.
+    if first.astimezone(BRUSSELS_TZ).replace(tzinfo=None) != naive:
+        return []
+    return sorted([first, second])
+
+
+def parse_bxl_times_to_utc(end_times: list[str], reference: datetime | None = None) -> list[str | None]:
+    """
+    Convert a batch of Brussels-local timestamps to UTC strings (None if invalid).
+
+    Each distinct string is parsed once. Ambiguous fall-back times are resolved
+    explicitly: with a `reference` time (e.g. now, for live data) the instant
+    closest to it is used; otherwise the first occurrence of the string in the
+    batch is the earlier instant and a repeat is the later one, which matches a
+    day of history records in time order.
+    """
+    results = []
+    seen_ambiguous: dict[str, int] = {}
+    for end_time in end_times:
+        if not isinstance(end_time, str):
+            results.append(None)
+            continue
+        if end_time in _UTC_CACHE:
+            results.append(_UTC_CACHE[end_time])
             continue
-    return None
+        naive = _parse_local_minute(end_time)
+        candidates = _local_to_utc_candidates(naive) if naive is not None else []
+
+        if len(candidates) == 2:
+            if reference is not None:
+                chosen = min(candidates, key=lambda c: abs(c - reference))
+            else:
+                occurrence = seen_ambiguous.get(end_time, 0)
+                seen_ambiguous[end_time] = occurrence + 1
+                chosen = candidates[min(occurrence, 1)]
+            # Not cached: the answer depends on the batch and reference.
+            results.append(chosen.strftime("%Y-%m-%d %H:%M:%S"))
+            continue
+
+        utc = candidates[0].strftime("%Y-%m-%d %H:%M:%S") if candidates else None
+        if len(_UTC_CACHE) >= _UTC_CACHE_MAX:
+            _UTC_CACHE.clear()
+        _UTC_CACHE[end_time] = utc
+        results.append(utc)
+    return results
 
 
 # 2. FETCH DATA ###################################
 
-# Ask the API for the "live" request payload at one-minute interval granularity.
-response = get_with_retry(
-    BASE_URL,
-    params={"request": "live", "includeLanes": "false", "interval": "1"},
-    timeout=30,
-)
-payload = response.json()
-data = payload.get("data", {})
+# Each worker thread keeps its own HTTP session (sessions are not shared across threads).
+_thread_local = threading.local()
+
+
+def _thread_session() -> requests.Session:
+    if not hasattr(_thread_local, "session"):
+        _thread_local.session = requests.Session()
+    return _thread_local.session
+
 
-# Hard-fail fast if API returns an empty payload so the cron run is visibly red.
-if not data:
-    raise SystemExit("Brussels traffic API returned empty data payload.")
+def load_sources(path: str | None = None) -> list[dict]:
+    """Read live sources from a JSON list (see DEFAULT_SOURCES); missing keys use the defaults."""
+    if not path:
+        return DEFAULT_SOURCES
+    with open(path, "r", encoding="utf-8") as f:
+        return [{**DEFAULT_SOURCES[0], **source} for source in json.load(f)]
 
-monitors = list(data.keys())
-print(f"   monitors in payload: {len(monitors)}")
+
+def stream_live_monitors(
+    session: requests.Session | None = None,
+    metrics: dict | None = None,
+    source: dict | None = None,
+    interval: int = 1,
+):
+    """
+    Ask the API for the "live" payload and yield (monitor_id, monitor_payload) pairs.
+
+    With ijson installed, monitors are parsed from the response body as it
+    downloads, so memory stays flat however large the payload is (lanes, more
+    intervals). Without it, the whole payload is loaded with response.json().
+    If `metrics` is given, metrics["monitors"] counts the monitors seen.
+    """
+    source = source or DEFAULT_SOURCES[0]
+    response = get_with_retry(
+        source["base_url"],
+        params={
+            "request": "live",
+            "includeLanes": "true" if source.get("include_lanes") else "false",
+            "interval": str(interval),
+        },
+        timeout=30,
+        session=session,
+        stream=True,
+    )
+    metrics = metrics if metrics is not None else {}
+    metrics["monitors"] = 0
+    with response:
+        if ijson is not None:
+            # Let urllib3 undo gzip so ijson sees plain JSON bytes.
+            response.raw.decode_content = True
+            monitors = ijson.kvitems(response.raw, "data", use_float=True)
+        else:
+            monitors = (response.json().get("data", {}) or {}).items()
+        # Reading response.raw directly bypasses requests' error wrapping, so a
+        # dropped connection or a truncated body is re-raised as the errors the
+        # callers already handle.
+        json_errors = (ijson.JSONError,) if ijson is not None else ()
+        try:
+            for monitor_id, monitor_payload in monitors:
+                metrics["monitors"] += 1
+                yield monitor_id, monitor_payload
+        except urllib3.exceptions.HTTPError as e:
+            raise requests.ConnectionError(f"{source['name']} live payload stream failed: {e}") from e
+        except json_errors as e:
+            raise RuntimeError(f"{source['name']} live payload is not valid JSON: {e}") from e
+
+    # Fail fast if API returns an empty payload so the run is visibly red.
+    if metrics["monitors"] == 0:
+        raise RuntimeError(f"{source['name']} API returned empty data payload (interval={interval}).")
 
 
 # 3. CLEAN DATA ###################################
 
-# Convert nested monitor payloads into flat rows with expected schema and types.
-rows = []
-for monitor_id, monitor_payload in data.items():
-    one_min = (monitor_payload.get("results", {}) or {}).get("1m", {}) or {}
-    t1 = one_min.get("t1", {}) or {}
-    vehicles = t1.get("count")
-    speed = t1.get("speed")
-    occupancy = t1.get("occupancy")
-    observed_at_raw = t1.get("end_time", "")
-    observed_at = parse_bxl_time_to_utc(observed_at_raw)
-
-    # Skip malformed rows early to keep downstream SQL simple and robust.
-    if vehicles is None or observed_at is None or not monitor_id:
-        continue
+def _lanes(monitor_payload: dict):
+    """Yield (lane_id, lane_payload) whether lanes come as a dict or a list."""
+    lanes = monitor_payload.get("lanes") or {}
+    if isinstance(lanes, dict):
+        yield from lanes.items()
+    else:
+        for i, lane in enumerate(lanes, start=1):
+            if isinstance(lane, dict):
+                yield lane.get("lane", lane.get("id", i)), lane
+
+
+def _slices(payload: dict, interval: int, all_slices: bool):
+    """Yield (time_slice, values) from one traverse or lane payload."""
+    results = (payload.get("results", {}) or {}).get(f"{interval}m", {}) or {}
+    if all_slices:
+        for time_slice, values in results.items():
+            if isinstance(values, dict):
+                yield time_slice, values
+    else:
+        yield "t1", results.get("t1", {}) or {}
+
+
+def iter_rows(
+    monitors,
+    metro_id: int = BRUSSELS_METRO_ID,
+    interval: int = 1,
+    all_slices: bool = False,
+    include_lanes: bool = False,
+    chunk_size: int = 1000,
+):
+    """
+    Yield (table, row) from (monitor_id, monitor_payload) pairs (or a dict of them).
 
-    try:
-        row = (
-            BRUSSELS_METRO_ID,
-            str(monitor_id),
-            observed_at,
-            int(vehicles),
-            max(float(speed), 0.0) if speed is not None else None,
-            float(occupancy) if occupancy is not None else None,
-        )
-        rows.append(row)
-    except (TypeError, ValueError):
-        continue
+    1m/t1 traverse totals go to "traffic"; other intervals, slices and lanes go
+    to "traffic_detail". Only the needed slices of each monitor are kept, and
+    end_time values are converted in chunks, so a streamed payload is never
+    held in memory at once.
+    """
+    items = monitors.items() if isinstance(monitors, dict) else monitors
+    entries = []
+    for monitor_id, monitor_payload in items:
+        for time_slice, values in _slices(monitor_payload, interval, all_slices):
+            entries.append((monitor_id, time_slice, "", values))
+        if include_lanes:
+            for lane, lane_payload in _lanes(monitor_payload):
+                for time_slice, values in _slices(lane_payload, interval, all_slices):
+                    entries.append((monitor_id, time_slice, str(lane), values))
+        if len(entries) >= chunk_size:
+            yield from _entries_to_rows(entries, metro_id, interval)
+            entries = []
+    yield from _entries_to_rows(entries, metro_id, interval)
+
+
+def _entries_to_rows(entries: list[tuple], metro_id: int, interval: int) -> list[tuple]:
+    # Convert all end_time values in one batch; live data is from the last few
+    # minutes, so "now" settles which instant an ambiguous autumn time means.
+    observed = parse_bxl_times_to_utc(
+        [values.get("end_time", "") for *_, values in entries], reference=datetime.now(timezone.utc)
+    )
 
-if not rows:
-    raise SystemExit("No valid 1m/t1 monitor rows parsed from Brussels API payload.")
+    rows = []
+    for (monitor_id, time_slice, lane, values), observed_at in zip(entries, observed):
+        vehicles = values.get("count")
+        speed = values.get("speed")
+        occupancy = values.get("occupancy")
+
+        # Skip malformed rows early to keep downstream SQL simple and robust.
+        if vehicles is None or observed_at is None or not monitor_id:
+            continue
 
-print(f"   parsed rows: {len(rows)}")
-print(f"   sample row: {rows[0]}")
+        try:
+            measures = (
+                int(vehicles),
+                max(float(speed), 0.0) if speed is not None else None,
+                float(occupancy) if occupancy is not None else None,
+            )
+        except (TypeError, ValueError):
+            continue
+        if interval == 1 and time_slice == "t1" and lane == "":
+            rows.append(("traffic", (metro_id, str(monitor_id), observed_at, *measures)))
+        else:
+            rows.append(("traffic_detail", (metro_id, str(monitor_id), interval, time_slice, lane, observed_at, *measures)))
+    return rows
 
 
 # 4. WRITE TO SQLITE ###################################
 
-# Keep database logic intentionally minimal and easy to read for students.
-conn = sqlite3.connect(str(DB_PATH))
-conn.execute(
+def open_db(path: Path = DB_PATH) -> sqlite3.Connection:
+    """Open traffic.db and make sure the traffic tables exist."""
+    # Keep database logic intentionally minimal and easy to read for students.
+    conn = sqlite3.connect(str(path))
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS traffic (
+          metro_id    INTEGER,
+          monitor_id  TEXT,
+          observed_at TEXT,
+          vehicles    INTEGER,
+          speed       REAL,
+          occupancy   REAL,
+          PRIMARY KEY (metro_id, monitor_id, observed_at)
+        )
     """
-    CREATE TABLE IF NOT EXISTS traffic (
-      metro_id    INTEGER,
-      monitor_id  TEXT,
-      observed_at TEXT,
-      vehicles    INTEGER,
-      speed       REAL,
-      occupancy   REAL,
-      PRIMARY KEY (metro_id, monitor_id, observed_at)
     )
-"""
-)
-conn.execute(
+    # traffic is the "hot" table for recent months; closed months are moved into
+    # sealed monthly partitions and read back through the traffic_all view.
+    ensure_partitioned_layout(conn)
+    # Hourly/daily rollups are updated by a trigger in the same transaction as each insert.
+    ensure_rollups(conn)
+    # Other intervals, time slices and lanes (lane = '' for the traverse total).
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS traffic_detail (
+          metro_id         INTEGER,
+          monitor_id       TEXT,
+          interval_minutes INTEGER,
+          time_slice       TEXT,
+          lane             TEXT,
+          observed_at      TEXT,
+          vehicles         INTEGER,
+          speed            REAL,
+          occupancy        REAL,
+          PRIMARY KEY (metro_id, monitor_id, interval_minutes, time_slice, lane, observed_at)
+        ) WITHOUT ROWID
     """
-    CREATE UNIQUE INDEX IF NOT EXISTS idx_traffic_metro_monitor_observed
-    ON traffic (metro_id, monitor_id, observed_at)
-"""
-)
+    )
+    # Backfill progress: one row per (traverse, day) fetched, so a long backfill
+    # can be stopped and restarted without fetching loaded days again.
+    # finished_at is NULL for attempts that are not complete yet (see run_backfill).
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS backfill_checkpoints (
+          metro_id    INTEGER,
+          monitor_id  TEXT,
+          day         TEXT,
+          rows        INTEGER,
+          finished_at TEXT,
+          PRIMARY KEY (metro_id, monitor_id, day)
+        )
+    """
+    )
+    return conn
 
-# Capture count before insert so we can report new rows appended this run.
-before_count = conn.execute(
-    "SELECT COUNT(*) FROM traffic WHERE metro_id = ?",
-    (BRUSSELS_METRO_ID,),
-).fetchone()[0]
 
-# Insert rows and ignore duplicates so repeated cron runs stay idempotent.
-conn.executemany(
+def write_batch(conn: sqlite3.Connection, rows: list[tuple], detail_rows: list[tuple]) -> tuple[int, int]:
+    """Insert traffic and traffic_detail rows in one transaction; return the new row counts."""
+    inserted = inserted_detail = 0
+    with conn:
+        if rows:
+            # Duplicates (also in sealed or archived months) are skipped, so repeated runs stay idempotent.
+            inserted = insert_traffic_rows(conn, rows, ARCHIVE_DIR)
+        if detail_rows:
+            inserted_detail = max(conn.executemany(DETAIL_INSERT_SQL, detail_rows).rowcount, 0)
+    return inserted, inserted_detail
+
+
+def flush_spool(spool: RowSpool, conn: sqlite3.Connection, max_attempts: int = FLUSH_ATTEMPTS) -> dict:
     """
-    INSERT INTO traffic (metro_id, monitor_id, observed_at, vehicles, speed, occupancy)
-    VALUES (?, ?, ?, ?, ?, ?)
-    ON CONFLICT(metro_id, monitor_id, observed_at) DO NOTHING
-""",
-    rows,
-)
-conn.commit()
+    Drain every sealed spool segment into traffic.db in one large transaction.
 
-# Count rows after insert and calculate net-new inserts for this run.
-total_rows = conn.execute(
-    "SELECT COUNT(*) FROM traffic WHERE metro_id = ?",
-    (BRUSSELS_METRO_ID,),
-).fetchone()[0]
-inserted_rows = max(int(total_rows) - int(before_count), 0)
-conn.close()
+    If the database is locked (e.g. by a long training read), wait and retry.
+    If it is still locked after max_attempts, or the flush fails in any other
+    way, the segments go back to the spool for the next flush and the error is
+    raised; no rows are lost and no segment is left behind as .flushing.
+    """
+    paths = spool.claim()
+    start = time.perf_counter()
+    inserted = inserted_detail = 0
+    done = False
+    try:
+        batches = [batch for path in paths for batch in spool.read(path)]
+        rows = [tuple(row) for batch in batches for row in batch.get("rows", [])]
+        detail_rows = [tuple(row) for batch in batches for row in batch.get("detail_rows", [])]
+
+        for attempt in range(1, max_attempts + 1):
+            try:
+                inserted, inserted_detail = write_batch(conn, rows, detail_rows)
+                break
+            except sqlite3.OperationalError as e:
+                busy = "locked" in str(e) or "busy" in str(e)
+                if not busy or attempt == max_attempts:
+                    raise
+                sleep_seconds = min(2 ** attempt, 30)
+                print(f"   warning {e}; retrying flush in {sleep_seconds}s (attempt {attempt}/{max_attempts})")
+                time.sleep(sleep_seconds)
+        done = True
+    finally:
+        # Committed segments are deleted; on any error they become .ready again.
+        spool.release(paths, done=done)
+
+    return {
+        "flushed_segments": len(paths),
+        "flushed_rows": len(rows),
+        "inserted_rows": inserted,
+        "duplicate_rows": len(rows) - inserted,
+        "detail_flushed_rows": len(detail_rows),
+        "detail_inserted_rows": inserted_detail,
+        "write_ms": round((time.perf_counter() - start) * 1000, 1),
+        "spool_backlog": spool.backlog(),
+    }
+
+
+## 4.1 Backfill #################################
+
+def fetch_history(monitor_id: str, day: date) -> list:
+    """Fetch one traverse's one-minute history for one (Brussels-local) day; ValueError if the payload is malformed."""
+    stamp = day.strftime("%Y%m%d")
+    response = get_with_retry(
+        BASE_URL,
+        params={"request": "history", "featureID": monitor_id, "startDate": stamp, "endDate": stamp, "interval": "1"},
+        timeout=60,
+        session=_thread_session(),
+    )
+    payload = response.json()
+    if not isinstance(payload, dict):
+        raise ValueError(f"history payload is a {type(payload).__name__}, expected an object")
+    records = payload.get("data") or []
+    if not isinstance(records, list):
+        raise ValueError(f"history data is a {type(records).__name__}, expected a list of records")
+    return records
+
+
+def parse_history_rows(monitor_id: str, records: list) -> list[tuple]:
+    """Convert history records into the same row tuples as the live ingest; ValueError if they are not dicts."""
+    if not isinstance(records, list) or not all(isinstance(record, dict) for record in records):
+        raise ValueError(f"history records for {monitor_id} are not a list of objects")
+    end_times = []
+    for record in records:
+        # History records carry either an end_time, or a date plus hour/minute.
+        end_time = record.get("end_time")
+        if not end_time and record.get("date") is not None:
+            try:
+                end_time = f"{record['date']} {int(record.get('hour', 0)):02d}:{int(record.get('minute', 0)):02d}"
+            except (TypeError, ValueError):
+                end_time = None
+        end_times.append(end_time or "")
+
+    # Records are in time order, so a repeated autumn fall-back time is the later instant.
+    rows = []
+    for record, observed_at in zip(records, parse_bxl_times_to_utc(end_times)):
+        vehicles = record.get("count")
+        speed = record.get("speed")
+        occupancy = record.get("occupancy")
+        if vehicles is None or observed_at is None:
+            continue
+        try:
+            rows.append((
+                BRUSSELS_METRO_ID,
+                str(monitor_id),
+                observed_at,
+                int(vehicles),
+                max(float(speed), 0.0) if speed is not None else None,
+                float(occupancy) if occupancy is not None else None,
+            ))
+        except (TypeError, ValueError):
+            continue
+    return rows
 
 
-# 5. VERIFY ###################################
+def run_backfill(start: date, end: date, monitor_ids: list[str] | None = None, workers: int = BACKFILL_WORKERS) -> None:
+    """Fill [start, end] (inclusive, Brussels-local days) for each traverse, resuming from checkpoints."""
+    conn = open_db()
 
-print(f"   candidate rows this run: {len(rows)}")
-print(f"   new rows appended: {inserted_rows}")
-print(f"   total rows (metro): {int(total_rows)}")
+    # Default to every traverse we have seen before.
+    if not monitor_ids:
+        monitor_ids = [
+            r[0]
+            for r in conn.execute(
+                "SELECT DISTINCT monitor_id FROM traffic WHERE metro_id = ? ORDER BY monitor_id",
+                (BRUSSELS_METRO_ID,),
+            )
+        ]
+    if not monitor_ids:
+        raise RuntimeError("No traverses given and none found in traffic.db; pass --traverses.")
+
+    # Work out which (traverse, day) chunks are still missing. Attempts that were
+    # not complete (finished_at is NULL) are fetched again.
+    done = {
+        (r[0], r[1])
+        for r in conn.execute(
+            "SELECT monitor_id, day FROM backfill_checkpoints WHERE metro_id = ? AND finished_at IS NOT NULL",
+            (BRUSSELS_METRO_ID,),
+        )
+    }
+    days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+    chunks = [(m, d) for m in monitor_ids for d in days if (m, d.isoformat()) not in done]
+    print(f"   backfill {start} to {end}: {len(monitor_ids)} traverses, {len(chunks)} chunks to fetch ({len(done)} done before)")
+
+    # Fetch concurrently (bounded by `workers`), but write from this thread only,
+    # so there is a single SQLite writer. Each chunk's rows and its checkpoint
+    # commit together: a chunk is either fully loaded and marked done, or not at all.
+    # Only a past Brussels day that returned rows is marked done; an empty day or
+    # today (still filling) is recorded as an attempt and fetched again next run.
+    today = datetime.now(BRUSSELS_TZ).date()
+    inserted_total = 0
+    failed = 0
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(fetch_history, m, d): (m, d) for m, d in chunks}
+            for i, future in enumerate(as_completed(futures), start=1):
+                monitor_id, day = futures[future]
+                try:
+                    rows = parse_history_rows(monitor_id, future.result())
+                except (requests.RequestException, RuntimeError, ValueError) as e:
+                    failed += 1
+                    print(f"   warning {monitor_id} {day}: {e}")
+                    continue
+                complete = bool(rows) and day < today
+                finished_at = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()) if complete else None
+                with conn:
+                    inserted = insert_traffic_rows(conn, rows, ARCHIVE_DIR)
+                    conn.execute(
+                        "INSERT OR REPLACE INTO backfill_checkpoints VALUES (?, ?, ?, ?, ?)",
+                        (BRUSSELS_METRO_ID, monitor_id, day.isoformat(), len(rows), finished_at),
+                    )
+                inserted_total += inserted
+                note = "" if complete else " (not complete yet, fetched again next run)"
+                print(f"   [{i}/{len(chunks)}] {monitor_id} {day}: {len(rows)} rows, {inserted} new{note}")
+    finally:
+        conn.close()
+
+    print(f"   backfill new rows: {inserted_total} | failed chunks: {failed} (rerun to retry them)")
+
+
+# 5. RUN ###################################
+
+def fetch_job(source: dict, interval: int, session: requests.Session | None = None) -> dict:
+    """Fetch and clean one (source, interval) live payload; safe to run in a worker thread."""
+    metrics = {"source": source["name"], "interval": interval}
+
+    # The payload is streamed: fetch_ms is the time to the first monitor,
+    # parse_ms covers downloading and parsing the rest of the body.
+    start = time.perf_counter()
+    monitors = stream_live_monitors(session or _thread_session(), metrics, source, interval)
+    first = next(monitors, None)
+    metrics["fetch_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+    start = time.perf_counter()
+    rows, detail_rows = [], []
+    for table, row in iter_rows(
+        itertools.chain([first] if first else [], monitors),
+        source["metro_id"],
+        interval,
+        source.get("all_slices", False),
+        source.get("include_lanes", False),
+    ):
+        (rows if table == "traffic" else detail_rows).append(row)
+    metrics["parse_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+    if not rows and not detail_rows:
+        raise RuntimeError(f"No valid monitor rows parsed from {source['name']} API payload (interval={interval}).")
+    return {"rows": rows, "detail_rows": detail_rows, "metrics": metrics}
+
+
+def run_once(
+    session: requests.Session | None = None,
+    conn: sqlite3.Connection | None = None,
+    sources: list[dict] | None = None,
+    pool: ThreadPoolExecutor | None = None,
+    workers: int = FETCH_WORKERS,
+    spool: RowSpool | None = None,
+    flush: bool = True,
+) -> dict:
+    """Fetch, clean and store one live payload per (source, interval); return structured run metrics."""
+    sources = sources or DEFAULT_SOURCES
+    jobs = [(source, interval) for source in sources for interval in source["intervals"]]
+    metro_ids = sorted({source["metro_id"] for source in sources})
+    metrics = {
+        "run_at": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()),
+        "metro_id": metro_ids[0] if len(metro_ids) == 1 else metro_ids,
+        "jobs": len(jobs),
+    }
+
+    # One job (the default) runs right here on the caller's session. Several jobs
+    # are fetched concurrently; a failing job is logged without losing the others.
+    results, errors = [], []
+    if len(jobs) == 1:
+        results.append(fetch_job(*jobs[0], session=session))
+    else:
+        own_pool = pool is None
+        pool = pool or ThreadPoolExecutor(max_workers=min(workers, len(jobs)))
+        try:
+            futures = {pool.submit(fetch_job, source, interval): (source, interval) for source, interval in jobs}
+            for future in as_completed(futures):
+                source, interval = futures[future]
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    errors.append(f"{source['name']}/{interval}m: {e}")
+                    print(f"   warning {source['name']} interval={interval} failed: {e}")
+        finally:
+            if own_pool:
+                pool.shutdown()
+        if not results:
+            raise RuntimeError(f"All {len(jobs)} live jobs failed: {'; '.join(errors)}")
+
+    rows = [row for result in results for row in result["rows"]]
+    detail_rows = [row for result in results for row in result["detail_rows"]]
+    # Jobs overlap, so the slowest job is what the run waited for.
+    metrics["fetch_ms"] = max(result["metrics"]["fetch_ms"] for result in results)
+    metrics["parse_ms"] = max(result["metrics"]["parse_ms"] for result in results)
+    metrics["monitors"] = sum(result["metrics"]["monitors"] for result in results)
+    print(f"   sample row: {rows[0] if rows else detail_rows[0]}")
+
+    # Spool first: once the batch is on disk, a locked database can only delay
+    # it, never lose it. Every job's rows go into traffic.db in one transaction.
+    spool = spool or RowSpool(SPOOL_DIR)
+    spool.append({"rows": rows, "detail_rows": detail_rows})
+    metrics["candidate_rows"] = len(rows)
+    metrics["detail_candidate_rows"] = len(detail_rows)
+    if errors:
+        metrics["errors"] = errors
+
+    # Flush now (one-shot runs), or leave it to the daemon's flusher thread.
+    # Flush counts include any batches left in the spool by earlier runs.
+    if flush:
+        spool.seal()
+        own_conn = conn is None
+        conn = conn or open_db()
+        try:
+            metrics.update(flush_spool(spool, conn))
+        except sqlite3.OperationalError as e:
+            print(f"   warning flush failed, rows stay in the spool for the next run: {e}")
+            metrics["flush_error"] = str(e)
+        finally:
+            if own_conn:
+                conn.close()
+
+    # Verify: one JSON line per run, easy to grep or load into a log tool.
+    print(f"   metrics: {json.dumps(metrics)}")
+    return metrics
+
+
+def run_flusher(spool: RowSpool, stop: threading.Event, flush_seconds: int = FLUSH_SECONDS) -> None:
+    """Daemon thread: flush the spool every flush_seconds, and compact when a month closes."""
+    # This thread is the only one that writes to traffic.db.
+    conn = open_db()
+    current_month = time.strftime("%Y-%m", time.gmtime())
+    try:
+        while True:
+            stopping = stop.wait(flush_seconds)
+            spool.seal()
+            try:
+                result = flush_spool(spool, conn)
+                if result["flushed_segments"]:
+                    print(f"   flush: {json.dumps(result)}")
+            except Exception as e:
+                # Any error must not end this thread: the rows stay in the spool for the next flush.
+                print(f"   warning flush failed, will retry: {e!r}")
+
+            # When a new month starts, move the month that just closed into its own partition.
+            if time.strftime("%Y-%m", time.gmtime()) != current_month:
+                current_month = time.strftime("%Y-%m", time.gmtime())
+                try:
+                    print(f"   compacted partitions: {compact_partitions(conn)}")
+                except Exception as e:
+                    print(f"   warning compaction failed: {e!r}")
+            if stopping:
+                break
+    finally:
+        conn.close()
+
+
+def run_daemon(
+    tick_seconds: int = TICK_SECONDS,
+    offset_seconds: int = TICK_OFFSET_SECONDS,
+    sources: list[dict] | None = None,
+    workers: int = FETCH_WORKERS,
+) -> None:
+    """Ingest once per tick, forever, reusing HTTP sessions and fetch threads."""
+    session = requests.Session()
+    # Fetch threads live as long as the daemon, so their sessions are reused too.
+    pool = ThreadPoolExecutor(max_workers=workers)
+    # Ticks only fetch and append to the spool; a separate flusher thread writes
+    # to traffic.db, so a slow or locked database never delays fetching.
+    spool = RowSpool(SPOOL_DIR)
+    stop = threading.Event()
+    flusher = threading.Thread(target=run_flusher, args=(spool, stop), daemon=True)
+    flusher.start()
+
+    # Ticks sit on a fixed grid (e.g. hh:mm:05 every minute). Each next tick is
+    # computed from the grid, not from when the last run finished, so slow runs
+    # never push the schedule later and ticks stay in step with the API's minutes.
+    next_tick = (time.time() // tick_seconds + 1) * tick_seconds + offset_seconds
+    print(f"   daemon mode: every {tick_seconds}s at +{offset_seconds}s (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(max(next_tick - time.time(), 0))
+            print(f"\n   tick {datetime.fromtimestamp(next_tick).strftime('%Y-%m-%d %H:%M:%S')}")
+            try:
+                run_once(session, sources=sources, pool=pool, spool=spool, flush=False)
+            except (requests.RequestException, RuntimeError, OSError) as e:
+                # Log and keep going; the next tick will try again.
+                print(f"   warning tick failed: {e}")
+
+            next_tick += tick_seconds
+            # If a run overran one or more ticks, skip them instead of running back-to-back.
+            skipped = 0
+            while next_tick <= time.time():
+                next_tick += tick_seconds
+                skipped += 1
+            if skipped:
+                print(f"   warning skipped {skipped} tick(s) after a slow run")
+    except KeyboardInterrupt:
+        print("\n   daemon stopped")
+    finally:
+        # Let the flusher write what is left in the spool before exiting.
+        stop.set()
+        flusher.join()
+        pool.shutdown()
+        session.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest Brussels realtime traffic counts into SQLite.")
+    parser.add_argument("--daemon", action="store_true", help="run continuously, once per tick")
+    parser.add_argument("--tick-seconds", type=int, default=TICK_SECONDS)
+    parser.add_argument("--offset-seconds", type=int, default=TICK_OFFSET_SECONDS)
+    parser.add_argument("--sources", help="JSON file listing live sources/intervals/lanes (default: Brussels 1m)")
+    parser.add_argument("--fetch-workers", type=int, default=FETCH_WORKERS, help="concurrent live requests")
+    parser.add_argument("--backfill", nargs=2, metavar=("START", "END"), help="backfill days START..END (YYYY-MM-DD)")
+    parser.add_argument("--traverses", default="", help="comma-separated traverse ids for --backfill (default: all known)")
+    parser.add_argument("--workers", type=int, default=BACKFILL_WORKERS, help="concurrent history requests for --backfill")
+    parser.add_argument("--compact", action="store_true", help="move closed months into sealed monthly partitions")
+    parser.add_argument("--flush", action="store_true", help="flush rows waiting in the spool into traffic.db")
+    parser.add_argument("--rebuild-rollups", action="store_true", help="recompute rollup tables from raw rows")
+    parser.add_argument("--archive", action="store_true", help="export sealed months to Parquet and drop them from SQLite")
+    parser.add_argument("--keep-months", type=int, default=0, help="sealed months to keep in SQLite for --archive")
+    args = parser.parse_args()
+
+    print("\n====================================================")
+    print("01_ingest_traffic.py | Brussels realtime ingest")
+    print("====================================================")
+    print(f"   metro_id: {BRUSSELS_METRO_ID}")
+    print(f"   api: {BASE_URL}")
+    sources = load_sources(args.sources)
+    if args.sources:
+        for source in sources:
+            print(f"   source: {source['name']} metro_id={source['metro_id']} intervals={source['intervals']}")
+
+    if args.flush:
+        conn = open_db()
+        print(f"   flush: {json.dumps(flush_spool(RowSpool(SPOOL_DIR), conn))}")
+        conn.close()
+    elif args.rebuild_rollups:
+        conn = open_db()
+        rebuild_rollups(conn)
+        print("   rollups rebuilt")
+        conn.close()
+    elif args.archive:
+        conn = open_db()
+        print(f"   archived partitions: {archive_partitions(conn, ARCHIVE_DIR, args.keep_months)}")
+        conn.close()
+    elif args.compact:
+        conn = open_db()
+        print(f"   compacted partitions: {compact_partitions(conn)}")
+        conn.close()
+    elif args.backfill:
+        start, end = (date.fromisoformat(d) for d in args.backfill)
+        traverses = [t.strip() for t in args.traverses.split(",") if t.strip()]
+        run_backfill(start, end, traverses, args.workers)
+    elif args.daemon:
+        run_daemon(args.tick_seconds, args.offset_seconds, sources, args.fetch_workers)
+    else:
+        # One-shot (cron) run: turn expected failures into a visible non-zero exit.
+        try:
+            run_once(sources=sources, workers=args.fetch_workers)
+        except RuntimeError as e:
+            raise SystemExit(str(e))
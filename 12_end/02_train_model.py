@@ -3,107 +3,517 @@
 # Pairs with 02_train_model.R
 # Tim Fraser
 
+# Training data is streamed from traffic.db (and the Parquet archive) in chunks
+# of typed NumPy arrays, so memory does not grow with years of minute data.
+# Use --external-memory to also keep XGBoost's training matrix on disk.
+# Use --incremental for nightly runs: the saved model keeps boosting on only
+# the rows that arrived since the last run, with a full retrain once a week.
+
 # 0. SETUP ###################################
 
 ## 0.1 Load Packages #################################
 
+import argparse
+import hashlib
 import numpy as np
-import pandas as pd
+import os
 import sqlite3
+import tempfile
+import time
 import xgboost as xgb
 import json
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 
+# Shared helpers for the time-partitioned layout of traffic.db (see functions.py)
+from functions import hour_cell_sql, scan_archive, traffic_query
+# Seeded splits and rolling-origin cross-validation (see splits.py)
+from splits import evaluate_folds, rolling_origin_folds, seeded_split
+# Parallel hyperparameter search for --tune (see tuning.py)
+from tuning import run_search
+
 # 1. CONFIG ###################################
 
 SCRIPT_DIR = Path(__file__).resolve().parent
 DATA_DIR = SCRIPT_DIR / "data"
 DB_PATH = SCRIPT_DIR / "data" / "traffic.db"
+ARCHIVE_DIR = DATA_DIR / "archive"
+CACHE_DIR = DATA_DIR / "xgb_cache"
 MODEL_PATH = DATA_DIR / "modelpy.json"
 VALIDATION_PATH = DATA_DIR / "validationpy.json"
+# Dense 7 x 24 standard error table for serving (see 03_fastapi/main.py)
+UNCERTAINTY_PATH = DATA_DIR / "uncertaintypy.npz"
+TUNING_PATH = DATA_DIR / "tuningpy.json"
 METRO_ID = 948
 
+# Rows per chunk read from SQLite/Parquet. Memory use is set by this, not by history length.
+CHUNK_ROWS = 100_000
+# The split is drawn chunk by chunk from a seeded generator, so every pass over
+# the data (XGBoost reads it more than once) puts each row on the same side.
+SPLIT_SEED = 42
+TRAIN_FRACTION = 0.8
+# --cv validates on the last CV_FOLDS blocks of this many days, one fold each.
+CV_HORIZON_DAYS = 7
+
+# Boosting rounds for a full retrain (unless --tune found a better number),
+# and the extra trees added per incremental run.
+FULL_ROUNDS = 50
+INCREMENTAL_ROUNDS = 10
+# Incremental runs switch to a full retrain once the last one is this old.
+FULL_RETRAIN_DAYS = 7
+# --tune holds out the most recent days of the window to score each candidate.
+TUNE_HOLDOUT_DAYS = 7
+
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 
+# Optional training window (UTC, "YYYY-MM-DD"); by default all history is used.
+parser = argparse.ArgumentParser(description="Train the Brussels traffic XGBoost model.")
+parser.add_argument("--start", help="only train on rows observed on/after this date")
+parser.add_argument("--end", help="only train on rows observed before this date")
+parser.add_argument(
+    "--source",
+    choices=["raw", "hourly"],
+    default="raw",
+    help="raw minutes, or the hourly per-monitor rollup (one weighted row per monitor-hour)",
+)
+parser.add_argument(
+    "--external-memory",
+    action="store_true",
+    help="keep the quantized training matrix in disk pages under data/xgb_cache/",
+)
+parser.add_argument(
+    "--incremental",
+    action="store_true",
+    help="continue boosting the saved model on rows newer than its training watermark",
+)
+parser.add_argument(
+    "--full-every-days",
+    type=float,
+    default=FULL_RETRAIN_DAYS,
+    help="with --incremental, retrain from scratch when the last full retrain is this many days old",
+)
+parser.add_argument(
+    "--tune",
+    action="store_true",
+    help="search XGBoost parameters first, write data/tuningpy.json, then do a full retrain with the winner",
+)
+parser.add_argument("--trials", type=int, default=12, help="parameter sets to try with --tune")
+parser.add_argument("--workers", type=int, help="processes for --tune and --cv (default: one per core)")
+parser.add_argument(
+    "--holdout-days",
+    type=float,
+    default=TUNE_HOLDOUT_DAYS,
+    help="with --tune, score candidates on this many most recent days, trained on the days before",
+)
+parser.add_argument(
+    "--cv",
+    type=int,
+    metavar="FOLDS",
+    help="also report rolling-origin cross-validation over this many folds of --cv-horizon-days each",
+)
+parser.add_argument("--cv-horizon-days", type=int, default=CV_HORIZON_DAYS, help="days validated per --cv fold")
+args = parser.parse_args()
+
+features = ["day_of_week", "hour_of_day"]
+
 # 2. LOAD DATA ###################################
 
-conn = sqlite3.connect(str(DB_PATH))
-df = pd.read_sql(
-    "SELECT observed_at, vehicles FROM traffic WHERE metro_id = ? ORDER BY observed_at",
-    conn,
-    params=(METRO_ID,),
-)
-conn.close()
+## 2.1 Calendar Features #################################
 
-# 3. FEATURE ENGINEERING ###################################
+# SQLite computes the features itself and returns one packed integer per row,
+# hour_cell = (day_of_week - 1) * 24 + hour_of_day (see functions.py), so no
+# timestamp strings are parsed in Python.
+def unpack_hour_cells(hour_cell: np.ndarray) -> np.ndarray:
+    """Turn packed hour_cell integers into an int32 [day_of_week (1=Mon), hour_of_day] array."""
+    day_index, hour_of_day = np.divmod(hour_cell.astype(np.int32), 24)
+    return np.column_stack([day_index + 1, hour_of_day]).astype(np.int32)
 
-if df.empty:
-    raise SystemExit("No rows found for configured METRO_ID.")
 
-df["observed_at"] = pd.to_datetime(df["observed_at"], utc=True)
-df["day_of_week"] = df["observed_at"].dt.dayofweek + 1
-df["hour_of_day"] = df["observed_at"].dt.hour
+# Parquet archive rows come with typed timestamps, so NumPy derives the same features.
+def calendar_features(minutes: np.ndarray) -> np.ndarray:
+    """Turn datetime64[m] UTC times into an int32 [day_of_week (1=Mon), hour_of_day] array."""
+    m = minutes.astype("datetime64[m]").astype(np.int64)
+    days = m // (24 * 60)
+    # 1970-01-01 was a Thursday (Monday = 0, so Thursday = 3).
+    day_of_week = (days + 3) % 7 + 1
+    hour_of_day = (m // 60) % 24
+    return np.column_stack([day_of_week, hour_of_day]).astype(np.int32)
 
-features = ["day_of_week", "hour_of_day"]
 
-# 4. TRAIN/TEST SPLIT ###################################
+## 2.2 Chunk Readers #################################
 
-df = df.reset_index(drop=True)
-df["row_id"] = np.arange(1, len(df) + 1)
+def day_number_sql(column: str) -> str:
+    """SQL for the UTC day number (days since 1970-01-01) of a timestamp column."""
+    return f"CAST(julianday({column}) - 2440587.5 AS INTEGER)"
 
-train_df = df.sample(frac=0.8)
-test_df = df[~df["row_id"].isin(train_df["row_id"])].copy()
 
-train_df = train_df.drop(columns=["row_id"])
-test_df = test_df.drop(columns=["row_id"])
+def sqlite_chunks(start: str | None, end: str | None, with_day: bool = False):
+    """
+    Yield (X, y, w) chunks for [start, end) from SQLite: the hourly rollup, or raw minutes from the partitions.
 
-if train_df.empty or test_df.empty:
-    raise SystemExit("Need at least 2 rows so both train and test sets are non-empty.")
+    with_day=True adds each row's day number, (X, y, w, day), for time-based folds.
+    """
+    conn = sqlite3.connect(str(DB_PATH))
+    try:
+        if args.source == "hourly":
+            # The rollup holds one row per monitor-hour with the minute count n.
+            # Training on the hourly mean, weighted by n, gives the same squared-error
+            # fit for our hour/day features as the raw minutes, from ~60x fewer rows.
+            sql = f"""
+                SELECT {hour_cell_sql("hour_at")}, CAST(vehicles_sum AS REAL) / n, n
+                       {", " + day_number_sql("hour_at") if with_day else ""}
+                FROM traffic_hourly_monitor
+                WHERE metro_id = ? AND hour_at >= ? AND hour_at < ?
+            """
+            params = [METRO_ID, start or "0000", end or "9999"]
+        else:
+            # traffic.db is partitioned by month; traffic_query() only reads the
+            # partitions that overlap the training window, plus the hot table.
+            # No ORDER BY: sorting all history is not needed and would cost a full pass.
+            # Only two integers per row: every extra column costs a Python object per row.
+            select = "{hour_cell}, vehicles" + (", " + day_number_sql("observed_at") if with_day else "")
+            sql, params = traffic_query(conn, select, METRO_ID, start=start, end=end, order_by=None)
+        cursor = conn.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(CHUNK_ROWS)
+            if not rows:
+                break
+            # Raw rows are integers only; hourly rows add a fractional mean and a weight.
+            values = np.array(rows, dtype=np.float64 if args.source == "hourly" else np.int32)
+            weight = values[:, 2] if args.source == "hourly" else np.ones(len(values))
+            chunk = (
+                unpack_hour_cells(values[:, 0]),
+                values[:, 1].astype(np.float32),
+                weight.astype(np.float32),
+            )
+            yield chunk + (values[:, -1].astype(np.int32),) if with_day else chunk
+    finally:
+        conn.close()
+
+
+def archive_chunks(start: str | None, end: str | None, with_day: bool = False):
+    """Yield (X, y, w) chunks for [start, end) from months archived to Parquet (01_ingest_traffic.py --archive)."""
+    # The hourly rollups keep archived months, so only raw training reads the archive.
+    if args.source != "raw":
+        return
+    for batch in scan_archive(
+        ARCHIVE_DIR, ["observed_at", "vehicles"], METRO_ID, start=start, end=end, batch_size=CHUNK_ROWS
+    ):
+        observed_at = batch.column("observed_at").to_numpy().astype("datetime64[m]")
+        vehicles = batch.column("vehicles").to_numpy(zero_copy_only=False).astype(np.float32)
+        chunk = (calendar_features(observed_at), vehicles, np.ones(len(vehicles), dtype=np.float32))
+        yield chunk + (observed_at.astype("datetime64[D]").astype(np.int32),) if with_day else chunk
+
+
+# XGBoost reads the training data twice and evaluation reads it twice more.
+# The first full pass saves each typed chunk to a temporary .npz file (16 bytes
+# per row), so later passes read compact binary files instead of querying SQLite.
+CHUNK_CACHE = tempfile.TemporaryDirectory(prefix="traffic_chunks_")
+chunk_files = []
+chunk_cache_complete = False
+
+
+def cached_chunks():
+    """Yield (X, y, w) chunks: from SQLite/Parquet on the first pass, from the .npy cache after that."""
+    global chunk_cache_complete
+    if chunk_cache_complete:
+        for path in chunk_files:
+            with np.load(path) as chunk:
+                yield chunk["X"], chunk["y"], chunk["w"]
+        return
+    chunk_files.clear()
+    for i, (X, y, w) in enumerate(source_chunks(window_start, window_end)):
+        path = Path(CHUNK_CACHE.name) / f"chunk_{i:06d}.npz"
+        np.savez(path, X=X, y=y, w=w)
+        chunk_files.append(path)
+        yield X, y, w
+    chunk_cache_complete = True
+
+
+def source_chunks(start: str | None, end: str | None, with_day: bool = False):
+    yield from archive_chunks(start, end, with_day)
+    yield from sqlite_chunks(start, end, with_day)
+
+
+def save_chunks(chunks, folder: Path) -> list[Path]:
+    """Write (X, y, w) chunks to .npz files in folder and return their paths."""
+    folder.mkdir(parents=True, exist_ok=True)
+    files = []
+    for i, (X, y, w) in enumerate(chunks):
+        path = folder / f"chunk_{i:06d}.npz"
+        np.savez(path, X=X, y=y, w=w)
+        files.append(path)
+    return files
+
+
+def train_test_chunks(part: str):
+    """Yield only the "train" or "test" rows of every cached chunk, using the seeded split (see splits.py)."""
+    # One generator for the whole pass, so a row's side does not depend on the chunking.
+    rng = np.random.default_rng(SPLIT_SEED)
+    for chunk in cached_chunks():
+        train, test = seeded_split(len(chunk[0]), TRAIN_FRACTION, rng)
+        rows = train if part == "train" else test
+        if len(rows):
+            yield tuple(array[rows] for array in chunk)
+
+
+## 2.3 XGBoost Data Iterator #################################
+
+class TrafficIter(xgb.DataIter):
+    """Feeds train chunks to XGBoost one at a time; XGBoost calls reset() before each pass."""
+
+    def __init__(self, cache_prefix: str | None = None):
+        self.chunks = None
+        super().__init__(cache_prefix=cache_prefix)
+
+    def reset(self) -> None:
+        self.chunks = None
+
+    def next(self, input_data) -> bool:
+        if self.chunks is None:
+            self.chunks = train_test_chunks("train")
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            return False
+        X, y, w = chunk
+        input_data(data=X, label=y, weight=w, feature_names=features)
+        return True
 
-X_train = train_df[features].to_numpy()
-y_train = train_df["vehicles"].to_numpy()
-X_test = test_df[features].to_numpy()
-y_test = test_df["vehicles"].to_numpy()
 
-# 5. TRAIN MODEL ###################################
+## 2.4 Full or Incremental Run #################################
 
-dtrain = xgb.DMatrix(X_train, label=y_train, feature_names=features)
+def latest_observation(since: str | None) -> str | None:
+    """Latest timestamp for METRO_ID in the training source (observed_at, or hour_at for the rollup)."""
+    conn = sqlite3.connect(str(DB_PATH))
+    try:
+        if args.source == "hourly":
+            sql = "SELECT MAX(hour_at) FROM traffic_hourly_monitor WHERE metro_id = ? AND hour_at >= ?"
+            params = [METRO_ID, since or "0000"]
+        else:
+            # Archived months are older than the rows still in SQLite, so they never hold the latest row.
+            sql, params = traffic_query(conn, "MAX(observed_at)", METRO_ID, start=since, order_by=None)
+        return max((row[0] for row in conn.execute(sql, params) if row[0] is not None), default=None)
+    finally:
+        conn.close()
 
-params = {
+
+def full_retrain_reason(previous: dict) -> str | None:
+    """Why this run must train from scratch, or None if the saved model can keep boosting."""
+    if args.tune:
+        return "hyperparameter search requested"
+    if not args.incremental:
+        return "full run requested"
+    if not MODEL_PATH.exists() or "training_watermark" not in previous or "evaluation_sums" not in previous:
+        return "no incremental state saved yet"
+    if previous.get("training_source") != args.source:
+        return "training source changed"
+    last_full = datetime.fromisoformat(previous["last_full_train"])
+    if datetime.now(timezone.utc) - last_full >= timedelta(days=args.full_every_days):
+        return f"last full retrain is more than {args.full_every_days:g} days old"
+    return None
+
+
+previous = json.loads(VALIDATION_PATH.read_text(encoding="utf-8")) if VALIDATION_PATH.exists() else {}
+retrain_reason = full_retrain_reason(previous)
+mode = "incremental" if retrain_reason is None else "full"
+
+# The watermark is the latest timestamp in the data, used as an exclusive end:
+# rows at that last minute (or the last, still-filling hourly rollup row) are
+# left for the next run, so an incremental run never trains on a row twice.
+# Rows that arrive late with an older timestamp are picked up by the next full retrain.
+window_start = previous["training_watermark"] if mode == "incremental" else args.start
+latest = latest_observation(window_start)
+if latest is None and mode == "full":
+    raise SystemExit("No rows found for configured METRO_ID.")
+window_end = min(latest, args.end) if args.end and latest else latest
+if mode == "incremental" and (window_end is None or window_end <= window_start):
+    print(f"No new rows since the training watermark {window_start}; model unchanged.")
+    raise SystemExit(0)
+
+# 3. TRAIN MODEL ###################################
+
+## 3.1 Parameters #################################
+
+BASE_PARAMS = {
     "objective": "reg:squarederror",
-    "max_depth": 4,
-    "eta": 0.1,
+    "tree_method": "hist",
     "verbosity": 0,
 }
+params = {**BASE_PARAMS, "max_depth": 4, "eta": 0.1}
+full_rounds = FULL_ROUNDS
+
+if args.tune:
+    # Time-based holdout: candidates train on rows before the cutoff and are
+    # scored (with early stopping) on the most recent days, as in production.
+    cutoff = datetime.fromisoformat(window_end) - timedelta(days=args.holdout_days)
+    cutoff = cutoff.strftime("%Y-%m-%d %H:%M:%S")
+    if window_start is not None and cutoff <= window_start:
+        raise SystemExit(f"The {args.holdout_days:g}-day holdout leaves no rows to tune on; use --holdout-days.")
+    tune_dir = Path(CHUNK_CACHE.name)
+    train_files = save_chunks(source_chunks(window_start, cutoff), tune_dir / "tune_train")
+    valid_files = save_chunks(source_chunks(cutoff, window_end), tune_dir / "tune_valid")
+    if not train_files or not valid_files:
+        raise SystemExit("Need rows on both sides of the holdout cutoff to tune.")
+    # Both halves together are the whole window, so they also serve as the chunk cache below.
+    chunk_files[:] = train_files + valid_files
+    chunk_cache_complete = True
 
-model = xgb.train(params, dtrain, num_boost_round=50)
+    # Search before this process runs XGBoost itself, so workers fork from a clean state.
+    tune_start = time.perf_counter()
+    leaderboard = run_search(
+        BASE_PARAMS, train_files, valid_files, features, trials=args.trials, workers=args.workers
+    )
+    tuning = {
+        "metro_id": int(METRO_ID),
+        "training_source": args.source,
+        "tuned_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "train_window": [window_start, cutoff],
+        "holdout_window": [cutoff, window_end],
+        "best_params": leaderboard[0]["params"],
+        "best_rounds": leaderboard[0]["rounds"],
+        "leaderboard": leaderboard,
+    }
+    TUNING_PATH.write_text(json.dumps(tuning, indent=2), encoding="utf-8")
+    print(f"Tried {len(leaderboard)} parameter sets in {time.perf_counter() - tune_start:.1f}s; best holdout RMSE:")
+    for row in leaderboard[:5]:
+        print(f"   {row['valid_rmse']:.3f} | {row['rounds']} rounds | {row['params']}")
 
-# 6. EVALUATE ###################################
+# Use the winning parameters of the last --tune run on the same source, if any.
+if TUNING_PATH.exists():
+    tuned = json.loads(TUNING_PATH.read_text(encoding="utf-8"))
+    if tuned.get("metro_id") == METRO_ID and tuned.get("training_source") == args.source:
+        params.update(tuned["best_params"])
+        full_rounds = tuned["best_rounds"]
 
-pred_train = model.predict(dtrain)
-train_rmse = np.sqrt(np.mean((pred_train - y_train) ** 2))
-train_r_squared = 1 - np.sum((y_train - pred_train) ** 2) / np.sum((y_train - np.mean(y_train)) ** 2)
+## 3.2 Rolling-Origin Cross-Validation (--cv) #################################
 
-dtest = xgb.DMatrix(X_test, label=y_test, feature_names=features)
-pred_test = model.predict(dtest)
-test_rmse = np.sqrt(np.mean((pred_test - y_test) ** 2))
-test_r_squared = 1 - np.sum((y_test - pred_test) ** 2) / np.sum((y_test - np.mean(y_test)) ** 2)
+# Each fold retrains on all history before a week and scores that week, so the
+# report shows how the model holds up on days it has not seen. It runs before
+# the final fit, so the fold workers fork before this process runs XGBoost.
+cross_validation = None
+if args.cv:
+    # The folds need every row in memory with its day number (16 + 4 bytes per row).
+    X_all, y_all, w_all, day_all = (
+        np.concatenate(parts) for parts in zip(*source_chunks(args.start, window_end, with_day=True))
+    )
+    folds = rolling_origin_folds(day_all, folds=args.cv, horizon=args.cv_horizon_days)
+    if not folds:
+        raise SystemExit(f"Not enough history for {args.cv} folds of {args.cv_horizon_days} days.")
+    cv_start = time.perf_counter()
+    fold_rows = evaluate_folds(params, full_rounds, X_all, y_all, w_all, folds, features, workers=args.workers)
+    del X_all, y_all, w_all, day_all, folds
+    cross_validation = {
+        "method": f"Rolling origin: train on all days before each {args.cv_horizon_days}-day block, score the block.",
+        "mean_rmse": float(np.mean([row["rmse"] for row in fold_rows])),
+        "folds": fold_rows,
+    }
+    print(f"Cross-validated {len(fold_rows)} folds in {time.perf_counter() - cv_start:.1f}s:")
+    for row in fold_rows:
+        rows = f"train {row['train_rows']} | valid {row['valid_rows']} rows"
+        print(f"   fold {row['fold']}: RMSE {row['rmse']:.3f} | {rows}")
+    print(f"   mean RMSE: {cross_validation['mean_rmse']:.3f}")
 
-test_eval = test_df[["day_of_week", "hour_of_day"]].copy()
-test_eval["residual"] = y_test - pred_test
-uncertainty_df = (
-    test_eval.groupby(["day_of_week", "hour_of_day"], as_index=False)
-    .agg(standard_error=("residual", "std"), n=("residual", "size"))
-)
-uncertainty_df["standard_error"] = uncertainty_df["standard_error"].fillna(float(test_rmse))
+## 3.3 Fit #################################
+
+# QuantileDMatrix stores each row as small bin indexes plus label and weight,
+# instead of a DataFrame; ExtMemQuantileDMatrix keeps even those in disk pages.
+if args.external_memory:
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    dtrain = xgb.ExtMemQuantileDMatrix(TrafficIter(cache_prefix=str(CACHE_DIR / "train")))
+else:
+    dtrain = xgb.QuantileDMatrix(TrafficIter())
+
+if dtrain.num_row() == 0:
+    if mode == "incremental":
+        print(f"No new training rows in [{window_start}, {window_end}); model unchanged.")
+        raise SystemExit(0)
+    raise SystemExit("No rows found for configured METRO_ID.")
+
+if mode == "incremental":
+    # Warm start: load the saved trees and add a few more, fit to the new rows only.
+    model = xgb.train(params, dtrain, num_boost_round=INCREMENTAL_ROUNDS, xgb_model=str(MODEL_PATH))
+else:
+    model = xgb.train(params, dtrain, num_boost_round=full_rounds)
+
+# 4. EVALUATE ###################################
+
+def evaluate(part: str) -> dict:
+    """
+    Stream one side of the split through the model and accumulate metrics.
+
+    Only running sums are kept (weighted by the minutes behind each row, all 1
+    for raw data), plus residual sums per day_of_week x hour_of_day cell.
+    """
+    sums = {
+        "rows": 0,
+        "w_sum": 0.0,
+        "wy_sum": 0.0,
+        "wy2_sum": 0.0,
+        "wsse": 0.0,
+        "cell_n": np.zeros((7, 24), dtype=np.int64),
+        "cell_sum": np.zeros((7, 24)),
+        "cell_sum2": np.zeros((7, 24)),
+    }
+    for X, y, w in train_test_chunks(part):
+        residual = (y - model.inplace_predict(X)).astype(np.float64)
+        sums["rows"] += len(y)
+        sums["w_sum"] += float(w.sum())
+        sums["wy_sum"] += float((w * y).sum())
+        sums["wy2_sum"] += float((w * y.astype(np.float64) ** 2).sum())
+        sums["wsse"] += float((w * residual**2).sum())
+        cell = (X[:, 0] - 1, X[:, 1])
+        np.add.at(sums["cell_n"], cell, 1)
+        np.add.at(sums["cell_sum"], cell, residual)
+        np.add.at(sums["cell_sum2"], cell, residual**2)
+    return sums
+
+
+def add_sums(sums: dict, saved: dict) -> dict:
+    """Add the running sums saved in validationpy.json by earlier runs to this run's sums."""
+    return {
+        key: value + (np.asarray(saved[key]) if isinstance(value, np.ndarray) else saved[key])
+        for key, value in sums.items()
+    }
+
+
+def metrics(sums: dict) -> tuple[float, float]:
+    """Weighted RMSE and R-squared from running sums."""
+    sst = sums["wy2_sum"] - sums["wy_sum"] ** 2 / sums["w_sum"]
+    rmse = float(np.sqrt(sums["wsse"] / sums["w_sum"]))
+    return rmse, float(1 - sums["wsse"] / sst) if sst > 0 else float("nan")
+
+
+train_eval = evaluate("train")
+test_eval = evaluate("test")
+window_rows = train_eval["rows"] + test_eval["rows"]
+# An incremental run only scores its new rows, so its sums are added to the
+# saved ones: metrics then cover every row since the last full retrain, each
+# scored by the model that was current when the row was trained on.
+if mode == "incremental":
+    train_eval = add_sums(train_eval, previous["evaluation_sums"]["train"])
+    test_eval = add_sums(test_eval, previous["evaluation_sums"]["test"])
+if test_eval["rows"] == 0 or train_eval["rows"] == 0:
+    raise SystemExit("Need at least 2 rows so both train and test sets are non-empty.")
+train_rmse, train_r_squared = metrics(train_eval)
+test_rmse, test_r_squared = metrics(test_eval)
+
+# Residual standard deviation per day/hour cell on the test split (sample SD,
+# like pandas .std()); cells with fewer than 2 rows fall back to the test RMSE.
+# With --source hourly, residuals are for hourly means, so these standard
+# errors describe an hour's average rather than a single minute.
+n = test_eval["cell_n"]
+with np.errstate(invalid="ignore", divide="ignore"):
+    variance = (test_eval["cell_sum2"] - test_eval["cell_sum"] ** 2 / n) / (n - 1)
+standard_error = np.where(n >= 2, np.sqrt(np.maximum(variance, 0)), test_rmse)
+# The same table as JSON rows, for reading by eye; serving loads the .npz sidecar.
 uncertainty_rows = [
     {
-        "day_of_week": int(row.day_of_week),
-        "hour_of_day": int(row.hour_of_day),
-        "standard_error": float(row.standard_error),
-        "n": int(row.n),
+        "day_of_week": int(d + 1),
+        "hour_of_day": int(h),
+        "standard_error": float(standard_error[d, h]),
+        "n": int(n[d, h]),
     }
-    for row in uncertainty_df.itertuples(index=False)
+    for d, h in zip(*np.nonzero(n))
 ]
 
 print(f"Training RMSE: {train_rmse:.2f}")
@@ -111,28 +521,83 @@ print(f"Training R-squared: {train_r_squared:.3f}")
 print(f"Testing RMSE: {test_rmse:.2f}")
 print(f"Testing R-squared: {test_r_squared:.3f}")
 
-# 7. SAVE MODEL ###################################
+# 5. SAVE MODEL ###################################
+
+def write_atomically(path: Path, write) -> None:
+    """
+    Call write() on a temporary file next to path, then rename it over path.
+
+    The API reloads these files while it runs (see 03_fastapi/main.py). A rename
+    within one folder is atomic, so it sees the old file or the new one, never
+    a half-written one.
+    """
+    # The temporary name keeps the extension, which XGBoost and NumPy go by.
+    temporary = path.with_name(f".tmp_{path.name}")
+    write(temporary)
+    os.replace(temporary, path)
+
 
-model.save_model(str(MODEL_PATH))
+write_atomically(MODEL_PATH, lambda path: model.save_model(str(path)))
+# The model version is a hash of the model file; the API reports it and only
+# pairs this model with the validation file that names the same version.
+model_version = hashlib.sha256(MODEL_PATH.read_bytes()).hexdigest()[:12]
+
+# Row d - 1, column h holds the standard error for day_of_week d, hour_of_day h,
+# so the API reads a cell with one index instead of building a lookup dict.
+write_atomically(
+    UNCERTAINTY_PATH,
+    lambda path: np.savez(
+        path,
+        standard_error=standard_error.astype(np.float32),
+        n=n.astype(np.int32),
+        default=np.float32(test_rmse),
+    ),
+)
+
+now = datetime.now(timezone.utc).isoformat(timespec="seconds")
+evaluation_sums = {
+    part: {key: value.tolist() if isinstance(value, np.ndarray) else value for key, value in sums.items()}
+    for part, sums in (("train", train_eval), ("test", test_eval))
+}
 
 validation = {
     "metro_id": int(METRO_ID),
+    "model_version": model_version,
     "test_rmse": float(test_rmse),
     "test_r_squared": float(test_r_squared),
     "train_rmse": float(train_rmse),
     "train_r_squared": float(train_r_squared),
     "residual_standard_error_default": float(test_rmse),
+    "training_source": args.source,
+    "params": {key: value for key, value in params.items() if key not in BASE_PARAMS},
     "standard_error_method": "Residual SD on held-out test split by day_of_week/hour_of_day; fallback to test RMSE.",
     "standard_error_by_hour_day": uncertainty_rows,
+    "standard_error_table": UNCERTAINTY_PATH.name,
+    "cross_validation": cross_validation,
+    # State for --incremental: the next run trains on rows from training_watermark on.
+    "training_mode": mode,
+    "training_window_start": window_start if mode == "full" else previous.get("training_window_start"),
+    "training_watermark": window_end,
+    "last_full_train": now if mode == "full" else previous["last_full_train"],
+    "last_train": now,
+    "boost_rounds": model.num_boosted_rounds(),
+    "evaluation_sums": evaluation_sums,
 }
-VALIDATION_PATH.write_text(json.dumps(validation, indent=2), encoding="utf-8")
+# Written last: once it names the new model_version, the API can load the new set of files.
+write_atomically(VALIDATION_PATH, lambda path: path.write_text(json.dumps(validation, indent=2), encoding="utf-8"))
 
 print("\n====================================================")
 print("02_train_model.py | Brussels realtime model")
 print("====================================================")
 print(f"   metro_id: {METRO_ID}")
-print(f"   train rows (80%): {len(train_df)}")
-print(f"   test rows (20%): {len(test_df)}")
+print(f"   mode: {mode} ({retrain_reason or 'rows since the last watermark'})")
+print(f"   rows in [{window_start or 'start'}, {window_end}): {window_rows}")
+print(f"   boosting rounds: {model.num_boosted_rounds()} | last full retrain: {validation['last_full_train']}")
+print(f"   train rows since last full retrain (80%): {train_eval['rows']}")
+print(f"   test rows since last full retrain (20%): {test_eval['rows']}")
+print(f"   source: {args.source} | chunks of {CHUNK_ROWS} rows | external memory: {args.external_memory}")
 print("   features: day_of_week, hour_of_day")
-print(f"   model saved to {MODEL_PATH}")
+print(f"   params: {validation['params']}")
+print(f"   model saved to {MODEL_PATH} (version {model_version})")
 print(f"   validation saved to {VALIDATION_PATH}")
+print(f"   standard error table saved to {UNCERTAINTY_PATH}")
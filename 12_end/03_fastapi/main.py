@@ -5,11 +5,19 @@
 
 # 0. SETUP ###################################
 
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel
 import xgboost as xgb
 import numpy as np
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
 from pathlib import Path
+import hashlib
 import json
+import os
+import threading
+import time
 
 
 def resolve_model_path() -> Path:
@@ -35,40 +43,251 @@ def resolve_validation_path() -> Path:
             return path
     return candidates[0]
 
+FEATURES = ["day_of_week", "hour_of_day"]
+# Largest number of (day, hour) pairs accepted by /predict/batch in one request
+MAX_BATCH = 10_000
+
 # 1. LOAD MODEL ###################################
 
-app = FastAPI()
-model = xgb.Booster()
-model.load_model(str(resolve_model_path()))
-validation_path = resolve_validation_path()
-validation = json.loads(validation_path.read_text(encoding="utf-8"))
-default_standard_error = float(validation.get("residual_standard_error_default", validation.get("test_rmse", 0.0)))
-se_by_hour_day = {
-    (int(row["day_of_week"]), int(row["hour_of_day"])): float(row["standard_error"])
-    for row in validation.get("standard_error_by_hour_day", [])
-}
+def build_prediction_table(booster: xgb.Booster) -> np.ndarray | None:
+    """
+    Predict all 7 x 24 (day_of_week, hour_of_day) cells in one call.
+
+    Row day_of_week - 1, column hour_of_day, like se_by_hour_day. Returns None
+    if the model uses other features, whose values cannot be listed up front.
+    """
+    if booster.feature_names not in (None, FEATURES):
+        return None
+    day_of_week, hour_of_day = np.meshgrid(np.arange(1, 8), np.arange(24), indexing="ij")
+    grid = np.column_stack([day_of_week.ravel(), hour_of_day.ravel()]).astype(np.float32)
+    return booster.inplace_predict(grid).reshape(7, 24)
+
+
+class ModelBundle:
+    """
+    One trained model with everything the endpoints need. Never changed after loading.
+
+    The model only sees two small integer features, so every possible request is
+    one of 168 cells. Predicting them all at load time (which also pays XGBoost's
+    one-off setup costs) turns each request into an array lookup.
+    """
+
+    def __init__(self, model_path: Path, validation_path: Path):
+        self.validation = json.loads(validation_path.read_text(encoding="utf-8"))
+        raw_model = model_path.read_bytes()
+        # The version is a hash of the model file. Training records it in validationpy.json,
+        # so a model file from a different run than the validation file is never paired with it.
+        self.version = hashlib.sha256(raw_model).hexdigest()[:12]
+        expected = self.validation.get("model_version")
+        if expected is not None and expected != self.version:
+            raise ValueError(f"model file {self.version} does not match validation ({expected}); still being written?")
+        self.model = xgb.Booster()
+        self.model.load_model(bytearray(raw_model))
+        # One thread per prediction: inputs are tiny, and the worker processes of
+        # serve.py already share the cores. It also keeps XGBoost from starting a
+        # thread pool before gunicorn forks its workers from this process.
+        self.model.set_param({"nthread": 1})
+        self.default_standard_error = float(
+            self.validation.get("residual_standard_error_default", self.validation.get("test_rmse", 0.0))
+        )
+
+        # Standard errors as a dense 7 x 24 array: row day_of_week - 1, column hour_of_day.
+        uncertainty_path = validation_path.with_name(self.validation.get("standard_error_table", "uncertaintypy.npz"))
+        if uncertainty_path.exists():
+            with np.load(uncertainty_path) as table:
+                self.se_by_hour_day = table["standard_error"]
+                self.default_standard_error = float(table["default"])
+        else:
+            # Older training output has only the JSON rows; fill the same array from them.
+            self.se_by_hour_day = np.full((7, 24), self.default_standard_error, dtype=np.float32)
+            for row in self.validation.get("standard_error_by_hour_day", []):
+                cell = (int(row["day_of_week"]) - 1, int(row["hour_of_day"]))
+                self.se_by_hour_day[cell] = float(row["standard_error"])
+
+        start = time.perf_counter()
+        self.prediction_table = build_prediction_table(self.model)
+        self.load_seconds = time.perf_counter() - start
+        self.loaded_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+class ModelRegistry:
+    """
+    Holds the active ModelBundle and swaps in a new one when training writes new files.
+
+    The new bundle is loaded and warmed up completely before the swap, and the
+    swap is one reference assignment, so requests keep being answered by the
+    old model until then and never see half of each. Each request reads
+    registry.current once and uses that bundle throughout.
+    """
+
+    def __init__(self, model_path: Path, validation_path: Path, poll_seconds: float = 5.0):
+        self.model_path = model_path
+        self.validation_path = validation_path
+        self.poll_seconds = poll_seconds
+        self.lock = threading.Lock()
+        self.stamp = self.file_stamp()
+        self.current = ModelBundle(model_path, validation_path)
+
+    def file_stamp(self) -> tuple:
+        """Modification time and size of the model files; any change means a new training run."""
+        return tuple((path.stat().st_mtime_ns, path.stat().st_size) for path in (self.model_path, self.validation_path))
+
+    def reload_if_changed(self) -> bool:
+        """Load and swap in the model files if they changed. Returns True if a new model is active."""
+        with self.lock:
+            try:
+                stamp = self.file_stamp()
+                if stamp == self.stamp:
+                    return False
+                bundle = ModelBundle(self.model_path, self.validation_path)
+            except (OSError, ValueError, xgb.core.XGBoostError) as error:
+                # Keep serving the current model; the next poll tries again.
+                print(f"   model reload skipped: {error}")
+                return False
+            previous, self.current, self.stamp = self.current.version, bundle, stamp
+        print(f"   model reloaded: {previous} -> {bundle.version} (warm-up {bundle.load_seconds:.3f}s)")
+        return True
+
+    def watch(self, stop: threading.Event) -> None:
+        """Check the model files every poll_seconds until stop is set."""
+        while not stop.wait(self.poll_seconds):
+            self.reload_if_changed()
+
+
+# Seconds between checks for a retrained model (0 turns hot reload off)
+registry = ModelRegistry(
+    resolve_model_path(), resolve_validation_path(), poll_seconds=float(os.getenv("MODEL_POLL_SECONDS", "5"))
+)
+print(f"   model {registry.current.version} | prediction table: {registry.current.load_seconds:.3f}s")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Watch for retrained models while the server runs."""
+    # Runs in every server process, so every worker watches for new models itself.
+    stop_watching = threading.Event()
+    if registry.poll_seconds > 0:
+        threading.Thread(target=registry.watch, args=(stop_watching,), daemon=True).start()
+    try:
+        yield
+    finally:
+        stop_watching.set()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # 2. DEFINE ENDPOINT ###################################
 
+# The handlers are async: a table lookup takes microseconds, so it runs right on
+# the event loop instead of being handed to FastAPI's threadpool like a plain
+# def handler. Only the rare booster call is slow and blocking, so only it
+# goes to the threadpool, keeping the event loop free for other requests.
+
+def booster_predict(model: xgb.Booster, day_of_week: np.ndarray, hour_of_day: np.ndarray) -> np.ndarray:
+    """Predict (day_of_week, hour_of_day) pairs with the booster itself."""
+    features = np.column_stack([day_of_week, hour_of_day]).astype(float)
+    return model.predict(xgb.DMatrix(features, feature_names=FEATURES))
+
+
 @app.get("/predict")
-def predict(day_of_week: int, hour_of_day: int):
-    features = np.array([[day_of_week, hour_of_day]], dtype=float)
-    dmat = xgb.DMatrix(features, feature_names=["day_of_week", "hour_of_day"])
-    pred = model.predict(dmat)
-    standard_error = se_by_hour_day.get((int(day_of_week), int(hour_of_day)), default_standard_error)
+async def predict(day_of_week: int, hour_of_day: int):
+    bundle = registry.current
+    in_table = 1 <= day_of_week <= 7 and 0 <= hour_of_day <= 23
+    if in_table and bundle.prediction_table is not None:
+        pred = bundle.prediction_table[day_of_week - 1, hour_of_day]
+    else:
+        # Out-of-range inputs (or a model with other features) still go through the booster.
+        pred = (await run_in_threadpool(booster_predict, bundle.model, [day_of_week], [hour_of_day]))[0]
+    if in_table:
+        standard_error = bundle.se_by_hour_day[day_of_week - 1, hour_of_day]
+    else:
+        standard_error = bundle.default_standard_error
     return {
-        "predicted_vehicle_count": round(float(pred[0]), 1),
+        "predicted_vehicle_count": round(float(pred), 1),
         "standard_error": round(float(standard_error), 3),
-        "standard_error_method": validation.get("standard_error_method"),
+        "standard_error_method": bundle.validation.get("standard_error_method"),
+        "model_version": bundle.version,
+    }
+
+
+class BatchRequest(BaseModel):
+    """Pairs to predict: equal-length day_of_week and hour_of_day lists, or full_week for all 168 cells."""
+
+    day_of_week: list[int] = []
+    hour_of_day: list[int] = []
+    full_week: bool = False
+
+
+@app.post("/predict/batch")
+async def predict_batch(request: BatchRequest):
+    if request.full_week:
+        day_of_week, hour_of_day = np.meshgrid(np.arange(1, 8), np.arange(24), indexing="ij")
+        day_of_week, hour_of_day = day_of_week.ravel(), hour_of_day.ravel()
+    else:
+        if len(request.day_of_week) != len(request.hour_of_day):
+            raise HTTPException(422, "day_of_week and hour_of_day must have the same length.")
+        day_of_week = np.array(request.day_of_week, dtype=np.int64)
+        hour_of_day = np.array(request.hour_of_day, dtype=np.int64)
+    if len(day_of_week) > MAX_BATCH:
+        raise HTTPException(422, f"At most {MAX_BATCH} pairs per request.")
+
+    bundle = registry.current
+    in_range = (day_of_week >= 1) & (day_of_week <= 7) & (hour_of_day >= 0) & (hour_of_day <= 23)
+    rows, cols = day_of_week[in_range] - 1, hour_of_day[in_range]
+
+    # All in-range pairs are one vectorized table lookup; any others go to the booster in a single call.
+    pred = np.empty(len(day_of_week))
+    from_booster = ~in_range
+    if bundle.prediction_table is not None:
+        pred[in_range] = bundle.prediction_table[rows, cols]
+    else:
+        from_booster[:] = True
+    if from_booster.any():
+        pred[from_booster] = await run_in_threadpool(
+            booster_predict, bundle.model, day_of_week[from_booster], hour_of_day[from_booster]
+        )
+    standard_error = np.full(len(day_of_week), bundle.default_standard_error)
+    standard_error[in_range] = bundle.se_by_hour_day[rows, cols]
+    return {
+        "day_of_week": day_of_week.tolist(),
+        "hour_of_day": hour_of_day.tolist(),
+        "predicted_vehicle_count": np.round(pred, 1).tolist(),
+        "standard_error": np.round(standard_error, 3).tolist(),
+        "standard_error_method": bundle.validation.get("standard_error_method"),
+        "model_version": bundle.version,
     }
 
 
 @app.get("/validation")
-def get_validation():
+async def get_validation():
+    bundle = registry.current
+    validation = bundle.validation
     return {
         "metro_id": validation.get("metro_id"),
         "test_rmse": validation.get("test_rmse"),
         "test_r_squared": validation.get("test_r_squared"),
         "train_rmse": validation.get("train_rmse"),
         "train_r_squared": validation.get("train_r_squared"),
+        "model_version": bundle.version,
     }
+
+
+@app.get("/model")
+async def get_model():
+    bundle = registry.current
+    return {
+        "model_version": bundle.version,
+        "loaded_at": bundle.loaded_at,
+        "trained_at": bundle.validation.get("last_train"),
+        "training_mode": bundle.validation.get("training_mode"),
+        "training_watermark": bundle.validation.get("training_watermark"),
+        "boost_rounds": bundle.validation.get("boost_rounds"),
+    }
+
+
+@app.post("/model/reload")
+def reload_model():
+    # Check for new model files now instead of waiting for the next poll.
+    # A plain def: loading files blocks, so FastAPI runs it in the threadpool.
+    reloaded = registry.reload_if_changed()
+    return {"reloaded": reloaded, "model_version": registry.current.version}
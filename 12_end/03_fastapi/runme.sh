@@ -2,6 +2,7 @@
 # runme.sh
 # Run FastAPI app locally with uvicorn.
 # Run from anywhere: bash 12_end/fastapi/runme.sh
+# For several worker processes (production), use: python 12_end/03_fastapi/serve.py
 
 set -euo pipefail
 DIR="$(cd "$(dirname "$0")" && pwd)"
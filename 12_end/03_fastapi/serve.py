@@ -0,0 +1,89 @@
+# serve.py
+# Production Server for the FastAPI App (Brussels Realtime)
+# Pairs with main.py and runme.sh
+# Tim Fraser
+
+# runme.sh starts one uvicorn process, which is handy while developing.
+# This script starts several worker processes, so requests use every core:
+# python serve.py                      # one worker per core, port 8000
+# python serve.py --workers 4 --port 8080
+# WEB_CONCURRENCY=2 PORT=8080 python serve.py
+
+# With gunicorn (Linux/macOS) the app is loaded once with --preload, before the
+# workers are forked. The model, prediction table and standard errors are then
+# shared by all workers through copy-on-write memory instead of being loaded
+# once per worker. Each worker still watches for retrained models and swaps
+# them in on its own (see ModelRegistry in main.py).
+# Without gunicorn (e.g. on Windows), uvicorn starts the workers itself, and
+# each one loads its own copy of the model.
+
+# 0. SETUP ###################################
+
+## 0.1 Load Packages #################################
+
+import argparse  # for command line options
+import importlib.util  # for checking which servers are installed
+import os        # for environment variables and starting the server in this process
+import sys
+from pathlib import Path
+
+# pip install fastapi uvicorn gunicorn uvicorn-worker
+
+APP_DIR = Path(__file__).resolve().parent
+
+## 0.2 Options #################################
+
+parser = argparse.ArgumentParser(description="Serve the traffic model API with several worker processes")
+parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+parser.add_argument(
+    "--workers",
+    type=int,
+    default=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)),
+    help="worker processes (default: WEB_CONCURRENCY, or one per core)",
+)
+parser.add_argument(
+    "--server",
+    choices=["auto", "gunicorn", "uvicorn"],
+    default="auto",
+    help="auto uses gunicorn when it is installed, otherwise uvicorn",
+)
+args = parser.parse_args()
+
+# 1. CHOOSE SERVER ###################################
+
+has_gunicorn = importlib.util.find_spec("gunicorn") is not None and sys.platform != "win32"
+server = args.server if args.server != "auto" else ("gunicorn" if has_gunicorn else "uvicorn")
+
+# The uvicorn worker class for gunicorn now lives in the uvicorn-worker package;
+# older uvicorn versions still ship it as uvicorn.workers.
+if importlib.util.find_spec("uvicorn_worker") is not None:
+    worker_class = "uvicorn_worker.UvicornWorker"
+else:
+    worker_class = "uvicorn.workers.UvicornWorker"
+
+print(f"🚦 Serving main:app on http://{args.host}:{args.port} | {server} | workers: {args.workers}")
+
+# 2. START ###################################
+
+if server == "gunicorn":
+    # Replace this process with gunicorn, so it receives stop signals directly.
+    os.execvp(sys.executable, [
+        sys.executable, "-m", "gunicorn", "main:app",
+        "--chdir", str(APP_DIR),
+        "--worker-class", worker_class,
+        "--workers", str(args.workers),
+        "--bind", f"{args.host}:{args.port}",
+        "--preload",               # load the app once, then fork workers that share it
+        "--keep-alive", "5",       # reuse client connections between requests
+        "--graceful-timeout", "30",  # finish in-flight requests on shutdown
+    ])
+else:
+    # The uvicorn command line, like runme.sh, with its own worker processes.
+    os.chdir(APP_DIR)
+    os.execvp(sys.executable, [
+        sys.executable, "-m", "uvicorn", "main:app",
+        "--workers", str(args.workers),
+        "--host", args.host,
+        "--port", str(args.port),
+    ])
@@ -44,9 +44,8 @@ def agent(messages, model=MODEL, output="text", tools=None):
         fn_name = tc["function"]["name"]
         raw_args = tc["function"]["arguments"]
         fn_args = raw_args if isinstance(raw_args, dict) else json.loads(raw_args)
-        # resolve the tool function from the calling script
-        import __main__
-        fn = getattr(__main__, fn_name, None)
+        # look up the tool function in the registry (a plain dict lookup)
+        fn = TOOL_REGISTRY.get(fn_name)
         tool_output = fn(**fn_args) if fn else {"error": "unknown tool"}
         if output == "text":
             return tool_output
@@ -62,20 +61,18 @@ def predict_vehicle_count(day_of_week, hours_of_day):
     if not hours:
         raise ValueError("hours_of_day must contain at least one integer between 0 and 23.")
 
-    predictions = []
-    for hour in hours:
-        resp = requests.get(
-            f"{ENDPOINT_URL}/predict",
-            params={"day_of_week": int(day_of_week), "hour_of_day": hour},
-            timeout=10,
-        )
-        resp.raise_for_status()
-        predictions.append(
-            {
-                "hour_of_day": hour,
-                "predicted_vehicle_count": float(resp.json()["predicted_vehicle_count"]),
-            }
-        )
+    # One request for all hours (/predict/batch), instead of one round trip per hour
+    resp = requests.post(
+        f"{ENDPOINT_URL}/predict/batch",
+        json={"day_of_week": [int(day_of_week)] * len(hours), "hour_of_day": hours},
+        timeout=10,
+    )
+    resp.raise_for_status()
+    batch = resp.json()
+    predictions = [
+        {"hour_of_day": hour, "predicted_vehicle_count": float(count)}
+        for hour, count in zip(batch["hour_of_day"], batch["predicted_vehicle_count"])
+    ]
 
     return {
         "day_of_week": int(day_of_week),
@@ -85,6 +82,9 @@ def predict_vehicle_count(day_of_week, hours_of_day):
         "predictions": predictions,
     }
 
+# Register tool functions by name so agent() can dispatch tool calls directly
+TOOL_REGISTRY = {"predict_vehicle_count": predict_vehicle_count}
+
 # 3. DEFINE TOOL METADATA ###################################
 
 tool_predict_vehicle_count = {
@@ -0,0 +1,152 @@
+# 05_load_test.py
+# Load Test the Traffic Model API
+# Pairs with 03_fastapi/serve.py
+# Tim Fraser
+
+# This script starts the API with 1, 2, 4, ... worker processes (03_fastapi/serve.py),
+# sends many concurrent /predict requests to each, and reports throughput and latency.
+# Throughput should grow with the number of workers until the cores run out.
+# The load comes from several client processes, since one Python client process
+# cannot send requests as fast as several server workers answer them.
+
+# Examples:
+# python 05_load_test.py
+# python 05_load_test.py --workers 1 2 4 8 --requests 20000 --concurrency 64
+# python 05_load_test.py --url http://localhost:8000   # test a server that is already running
+
+# 0. SETUP ###################################
+
+## 0.1 Load Packages #################################
+
+import argparse  # for command line options
+import os        # for counting cores
+import random    # for seeded request inputs
+import statistics  # for latency percentiles
+import subprocess  # for starting the server
+import sys
+import threading
+import time      # for timing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+SERVE_PATH = SCRIPT_DIR / "03_fastapi" / "serve.py"
+
+# 1. CLIENT ###################################
+
+_thread_local = threading.local()
+
+
+def one_request(url: str, day_of_week: int, hour_of_day: int) -> float:
+    """Time one /predict request on this thread's keep-alive session."""
+    session = getattr(_thread_local, "session", None)
+    if session is None:
+        session = _thread_local.session = requests.Session()
+    start = time.perf_counter()
+    resp = session.get(f"{url}/predict", params={"day_of_week": day_of_week, "hour_of_day": hour_of_day}, timeout=10)
+    resp.raise_for_status()
+    return time.perf_counter() - start
+
+
+def run_client(url: str, requests_count: int, threads: int, seed: int) -> list[float]:
+    """One client process: send requests_count requests from `threads` threads, return latencies."""
+    rng = random.Random(seed)
+    cells = [(rng.randint(1, 7), rng.randint(0, 23)) for _ in range(requests_count)]
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return list(pool.map(lambda cell: one_request(url, *cell), cells))
+
+
+def load_test(url: str, total: int, concurrency: int, clients: int) -> dict:
+    """Spread `total` requests over client processes, `concurrency` in flight at once."""
+    clients = max(1, min(clients, concurrency))
+    per_client = [total // clients + (i < total % clients) for i in range(clients)]
+    threads = max(1, concurrency // clients)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=clients) as pool:
+        parts = pool.map(run_client, [url] * clients, per_client, [threads] * clients, range(clients))
+        latencies = sorted(latency for part in parts for latency in part)
+    elapsed = time.perf_counter() - start
+    return {
+        "throughput": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(0.95 * (len(latencies) - 1))] * 1000,
+    }
+
+
+# 2. SERVER ###################################
+
+def start_server(workers: int, port: int, server: str) -> subprocess.Popen:
+    """Start serve.py with `workers` processes and wait until it answers."""
+    process = subprocess.Popen(
+        [sys.executable, str(SERVE_PATH), "--workers", str(workers), "--port", str(port),
+         "--host", "127.0.0.1", "--server", server],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            requests.get(f"{url}/model", timeout=1).raise_for_status()
+            return process
+        except requests.RequestException:
+            if process.poll() is not None:
+                break
+            time.sleep(0.25)
+    process.terminate()
+    raise SystemExit(f"The server with {workers} workers did not start; try python {SERVE_PATH} yourself.")
+
+
+def stop_server(process: subprocess.Popen) -> None:
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+# 3. RUN THE LOAD TEST ###################################
+
+if __name__ == "__main__":
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Load test /predict with different numbers of server workers")
+    parser.add_argument(
+        "--workers", type=int, nargs="+", help="worker counts to test (default: 1, 2, 4, ... up to the cores)"
+    )
+    parser.add_argument("--requests", type=int, default=5000, help="requests per worker count")
+    parser.add_argument("--concurrency", type=int, default=32, help="requests in flight at once")
+    parser.add_argument("--clients", type=int, default=cores, help="client processes sending the requests")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--server", choices=["auto", "gunicorn", "uvicorn"], default="auto")
+    parser.add_argument("--url", help="test this running server instead of starting serve.py")
+    args = parser.parse_args()
+
+    worker_counts = args.workers or [2**i for i in range(cores.bit_length()) if 2**i <= cores]
+    print(f"🚦 {args.requests} requests per run | concurrency: {args.concurrency} | client processes: {args.clients}")
+    print(f"   clients and server share this machine's {cores} cores, so scaling flattens before the core count")
+
+    runs = [(None, args.url)] if args.url else [(workers, None) for workers in worker_counts]
+    results = []
+    for workers, url in runs:
+        process = None if url else start_server(workers, args.port, args.server)
+        url = url or f"http://127.0.0.1:{args.port}"
+        try:
+            # Warm up each worker's connections before timing
+            load_test(url, min(500, args.requests), args.concurrency, args.clients)
+            result = load_test(url, args.requests, args.concurrency, args.clients)
+        finally:
+            if process is not None:
+                stop_server(process)
+        results.append((workers, result))
+
+    # 4. REPORT ###################################
+
+    baseline = results[0][1]["throughput"]
+    for workers, result in results:
+        label = f"workers: {workers}" if workers else f"url: {args.url}"
+        print(
+            f"   {label} | {result['throughput']:.0f} requests/s ({result['throughput'] / baseline:.1f}x)"
+            f" | p50: {result['p50_ms']:.1f} ms | p95: {result['p95_ms']:.1f} ms"
+        )
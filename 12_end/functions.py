@@ -0,0 +1,684 @@
+# functions.py
+# Traffic Storage Helper Functions
+# Used by 01_ingest_traffic.py and 02_train_model.py
+# Tim Fraser
+
+# This script contains shared helpers for the time-partitioned layout of traffic.db.
+# New rows land in the small "hot" traffic table. Closed months are moved into
+# read-only monthly tables (traffic_YYYY_MM), and the traffic_all view combines them.
+# Queries for a date range only read the tables that overlap it.
+# Small rollup tables (hourly per monitor, hourly per metro, daily per metro) are
+# kept up to date as rows are inserted, so most questions never scan raw minutes.
+# Sealed months can then be archived to Parquet files (data/archive/metro_id=.../date=...)
+# and dropped from SQLite, so traffic.db only keeps the recent window.
+# Fresh rows are first appended to a small on-disk spool (data/spool/) and flushed
+# into traffic.db from there, so a locked database never loses a minute of data.
+
+# 0. SETUP ###################################
+
+## 0.1 Load Packages #################################
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, timezone
+from pathlib import Path
+
+# pyarrow is only needed for the Parquet archive (pip install pyarrow);
+# it is imported inside those functions so everything else works without it.
+
+## 0.2 Configuration #################################
+
+HOT_TABLE = "traffic"
+ALL_VIEW = "traffic_all"
+CATALOG_TABLE = "traffic_partitions"
+ARCHIVE_TABLE = "traffic_archive"
+COLUMNS = "metro_id, monitor_id, observed_at, vehicles, speed, occupancy"
+
+# How many months (including the current one) stay in the hot table.
+HOT_MONTHS = 1
+
+# Spool: start a new segment file once the current one reaches this size, and
+# treat segments untouched for this long as left behind by a crashed process.
+SPOOL_SEGMENT_BYTES = 8 * 1024 * 1024
+SPOOL_STALE_SECONDS = 600
+
+# Rollup tables, from most to least detailed
+ROLLUP_TABLES = ["traffic_hourly_monitor", "traffic_hourly_metro", "traffic_daily_metro"]
+
+
+# 1. SCHEMA ###################################
+
+def hour_cell_sql(column: str = "observed_at") -> str:
+    """
+    SQL for the model's calendar features, packed into one integer per row.
+
+    hour_cell = (day_of_week - 1) * 24 + hour_of_day, with day_of_week 1 = Monday
+    (strftime('%w') counts from Sunday = 0). One small integer per row is much
+    cheaper to pull out of SQLite than a timestamp string that Python must parse.
+    """
+    return f"((CAST(strftime('%w', {column}) AS INTEGER) + 6) % 7) * 24 + CAST(substr({column}, 12, 2) AS INTEGER)"
+
+
+def has_column(conn: sqlite3.Connection, table: str, column: str) -> bool:
+    # table_xinfo (unlike table_info) also lists generated columns.
+    return any(r[1] == column for r in conn.execute(f"PRAGMA table_xinfo({table})"))
+
+
+def partition_name(month: str) -> str:
+    """Table name for a "YYYY-MM" month, e.g. traffic_2026_04."""
+    return f"{HOT_TABLE}_{month.replace('-', '_')}"
+
+
+def month_bounds(month: str) -> tuple[str, str]:
+    """Return [start, end) UTC timestamps for a "YYYY-MM" month."""
+    year, mon = (int(x) for x in month.split("-"))
+    next_year, next_mon = (year + 1, 1) if mon == 12 else (year, mon + 1)
+    return f"{year:04d}-{mon:02d}-01 00:00:00", f"{next_year:04d}-{next_mon:02d}-01 00:00:00"
+
+
+def ensure_partitioned_layout(conn: sqlite3.Connection) -> None:
+    """Create the partition catalog and traffic_all view, and drop the redundant index."""
+    # The PRIMARY KEY already indexes (metro_id, monitor_id, observed_at);
+    # a UNIQUE index on the same columns only doubles the write cost.
+    conn.execute("DROP INDEX IF EXISTS idx_traffic_metro_monitor_observed")
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {CATALOG_TABLE} (
+          name      TEXT PRIMARY KEY,
+          month     TEXT,
+          start_at  TEXT,
+          end_at    TEXT,
+          rows      INTEGER,
+          sealed_at TEXT
+        )
+    """
+    )
+    # One row per batch of rows exported to Parquet (see archive_partitions)
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {ARCHIVE_TABLE} (
+          batch       TEXT PRIMARY KEY,
+          month       TEXT,
+          rows        INTEGER,
+          archived_at TEXT
+        )
+    """
+    )
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'view' AND name = ?", (ALL_VIEW,)).fetchone() is None:
+        refresh_all_view(conn)
+    conn.commit()
+
+
+def refresh_all_view(conn: sqlite3.Connection) -> None:
+    """Rebuild traffic_all as the hot table plus every sealed monthly partition."""
+    tables = [HOT_TABLE] + [r[0] for r in conn.execute(f"SELECT name FROM {CATALOG_TABLE} ORDER BY month")]
+    union = "\nUNION ALL\n".join(f"SELECT {COLUMNS} FROM {t}" for t in tables)
+    conn.execute(f"DROP VIEW IF EXISTS {ALL_VIEW}")
+    conn.execute(f"CREATE VIEW {ALL_VIEW} AS\n{union}")
+
+
+# 2. PARTITION PRUNING ###################################
+
+def traffic_sources(conn: sqlite3.Connection, start: str | None = None, end: str | None = None) -> list[str]:
+    """List the tables that can hold rows with start <= observed_at < end."""
+    sources = []
+    # A database the ingester has not opened yet has no catalog: only the hot table exists.
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (CATALOG_TABLE,)).fetchone() is None:
+        return [HOT_TABLE]
+    for name, start_at, end_at in conn.execute(f"SELECT name, start_at, end_at FROM {CATALOG_TABLE} ORDER BY month"):
+        if (end is None or start_at < end) and (start is None or end_at > start):
+            sources.append(name)
+    # The hot table can hold any month (e.g. late or backfilled rows), so always include it.
+    return sources + [HOT_TABLE]
+
+
+def traffic_query(
+    conn: sqlite3.Connection,
+    select: str,
+    metro_id: int,
+    start: str | None = None,
+    end: str | None = None,
+    order_by: str | None = "observed_at",
+) -> tuple[str, list]:
+    """
+    Build a query over only the partitions that overlap [start, end).
+
+    `select` is the column list, e.g. "observed_at, vehicles". A "{hour_cell}"
+    placeholder becomes each table's stored hour_cell column where it has one
+    (sealed partitions), or the hour_cell_sql() expression otherwise.
+    Returns (sql, params) ready for pd.read_sql or conn.execute.
+    """
+    where = "metro_id = ?"
+    where_params = [metro_id]
+    if start is not None:
+        where += " AND observed_at >= ?"
+        where_params.append(start)
+    if end is not None:
+        where += " AND observed_at < ?"
+        where_params.append(end)
+
+    sources = traffic_sources(conn, start, end)
+    selects = []
+    for t in sources:
+        hour_cell = "hour_cell" if has_column(conn, t, "hour_cell") else hour_cell_sql()
+        selects.append(f"SELECT {select.replace('{hour_cell}', hour_cell)} FROM {t} WHERE {where}")
+    sql = "\nUNION ALL\n".join(selects)
+    if order_by:
+        sql += f"\nORDER BY {order_by}"
+    return sql, where_params * len(sources)
+
+
+# 3. COMPACTION ###################################
+
+def _seal(conn: sqlite3.Connection, name: str) -> None:
+    """Make a partition read-only with triggers that reject any write."""
+    for action in ("INSERT", "UPDATE", "DELETE"):
+        conn.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {name}_read_only_{action.lower()}
+            BEFORE {action} ON {name}
+            BEGIN SELECT RAISE(ABORT, '{name} is a sealed partition'); END
+        """
+        )
+
+
+def _unseal(conn: sqlite3.Connection, name: str) -> None:
+    for action in ("insert", "update", "delete"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}_read_only_{action}")
+
+
+def compact_partitions(conn: sqlite3.Connection, hot_months: int = HOT_MONTHS, today: date | None = None) -> list[str]:
+    """
+    Move closed months out of the hot table into sealed monthly partitions.
+
+    Rows older than the first day of the oldest hot month are copied, in primary
+    key order, into a WITHOUT ROWID table per month, deleted from the hot table,
+    and the partition is sealed read-only. Late rows for an already-sealed month
+    are merged in. Each partition stores the model's calendar features once
+    (hour_cell), so training reads them as integers. Returns the partitions written.
+    """
+    today = today or date.today()
+    month_index = today.year * 12 + (today.month - 1) - (hot_months - 1)
+    cutoff = f"{month_index // 12:04d}-{month_index % 12 + 1:02d}-01 00:00:00"
+
+    months = [
+        r[0]
+        for r in conn.execute(
+            f"SELECT DISTINCT substr(observed_at, 1, 7) FROM {HOT_TABLE} WHERE observed_at < ? ORDER BY 1",
+            (cutoff,),
+        )
+    ]
+
+    written = []
+    for month in months:
+        name = partition_name(month)
+        start_at, end_at = month_bounds(month)
+        with conn:
+            conn.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {name} (
+                  metro_id    INTEGER,
+                  monitor_id  TEXT,
+                  observed_at TEXT,
+                  vehicles    INTEGER,
+                  speed       REAL,
+                  occupancy   REAL,
+                  hour_cell   INTEGER GENERATED ALWAYS AS ({hour_cell_sql()}) STORED,
+                  PRIMARY KEY (metro_id, monitor_id, observed_at)
+                ) WITHOUT ROWID
+            """
+            )
+            _unseal(conn, name)
+            conn.execute(
+                f"""
+                INSERT OR IGNORE INTO {name} ({COLUMNS})
+                SELECT {COLUMNS} FROM {HOT_TABLE}
+                WHERE observed_at >= ? AND observed_at < ?
+                ORDER BY metro_id, monitor_id, observed_at
+            """,
+                (start_at, end_at),
+            )
+            conn.execute(f"DELETE FROM {HOT_TABLE} WHERE observed_at >= ? AND observed_at < ?", (start_at, end_at))
+            _seal(conn, name)
+            rows = conn.execute(f"SELECT COUNT(*) FROM {name}").fetchone()[0]
+            conn.execute(
+                f"INSERT OR REPLACE INTO {CATALOG_TABLE} VALUES (?, ?, ?, ?, ?, ?)",
+                (name, month, start_at, end_at, rows, time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())),
+            )
+            refresh_all_view(conn)
+        written.append(name)
+
+    # Rewrite the file so freed pages are reclaimed and partitions are stored contiguously.
+    if written:
+        conn.execute("VACUUM")
+    return written
+
+
+def archived_keys(archive_dir: Path, metro_id: int, month: str) -> set[tuple[str, str]]:
+    """Return the (monitor_id, observed_at) keys already archived to Parquet for one metro and month."""
+    import pyarrow.compute as pc
+
+    start_at, end_at = month_bounds(month)
+    keys = set()
+    for batch in scan_archive(archive_dir, ["monitor_id", "observed_at"], metro_id, start_at, end_at):
+        observed = pc.strftime(batch.column("observed_at"), format="%Y-%m-%d %H:%M:%S")
+        keys.update(zip(batch.column("monitor_id").to_pylist(), observed.to_pylist()))
+    return keys
+
+
+def insert_traffic_rows(conn: sqlite3.Connection, rows: list[tuple], archive_dir: Path) -> int:
+    """
+    Insert (metro_id, monitor_id, observed_at, ...) rows into the hot table; return how many were new.
+
+    ON CONFLICT only sees the hot table, so rows for a month that was already
+    sealed are checked against its partition, and rows for an archived month
+    against the keys in its Parquet files. Only rows that are new across every
+    partition are inserted, so backfills and re-flushed spool segments never
+    duplicate a row. Runs inside the caller's transaction.
+    """
+    sealed = dict(conn.execute(f"SELECT month, name FROM {CATALOG_TABLE}").fetchall())
+    archived = {r[0] for r in conn.execute(f"SELECT DISTINCT month FROM {ARCHIVE_TABLE}")}
+
+    by_month = {}
+    for row in rows:
+        by_month.setdefault(row[2][:7], []).append(row)
+
+    inserted = 0
+    for month, month_rows in by_month.items():
+        if month in archived:
+            for metro_id in {row[0] for row in month_rows}:
+                keys = archived_keys(archive_dir, metro_id, month)
+                month_rows = [row for row in month_rows if row[0] != metro_id or (row[1], row[2]) not in keys]
+        if month in sealed:
+            sql = f"""
+                INSERT INTO {HOT_TABLE} ({COLUMNS})
+                SELECT ?1, ?2, ?3, ?4, ?5, ?6
+                WHERE NOT EXISTS (
+                  SELECT 1 FROM {sealed[month]} WHERE metro_id = ?1 AND monitor_id = ?2 AND observed_at = ?3
+                )
+                ON CONFLICT(metro_id, monitor_id, observed_at) DO NOTHING
+            """
+        else:
+            sql = f"""
+                INSERT INTO {HOT_TABLE} ({COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(metro_id, monitor_id, observed_at) DO NOTHING
+            """
+        if month_rows:
+            inserted += max(conn.executemany(sql, month_rows).rowcount, 0)
+    return inserted
+
+
+# 4. ROLLUPS ###################################
+
+# Each rollup keeps sums and counts (not averages), so new rows can be added
+# incrementally and averages are computed at query time: vehicles_sum / n.
+ROLLUP_SCHEMA = {
+    "traffic_hourly_monitor": """
+        metro_id      INTEGER,
+        monitor_id    TEXT,
+        hour_at       TEXT,
+        n             INTEGER,
+        vehicles_sum  INTEGER,
+        speed_sum     REAL,
+        speed_n       INTEGER,
+        occupancy_sum REAL,
+        occupancy_n   INTEGER,
+        PRIMARY KEY (metro_id, monitor_id, hour_at)
+    """,
+    "traffic_hourly_metro": """
+        metro_id     INTEGER,
+        hour_at      TEXT,
+        n            INTEGER,
+        vehicles_sum INTEGER,
+        PRIMARY KEY (metro_id, hour_at)
+    """,
+    "traffic_daily_metro": """
+        metro_id     INTEGER,
+        day          TEXT,
+        n            INTEGER,
+        vehicles_sum INTEGER,
+        PRIMARY KEY (metro_id, day)
+    """,
+}
+
+# Trigger on the hot table: every row that is actually inserted is added to all
+# three rollups inside the same transaction as the raw insert. Rows that already
+# exist in the hot table, a sealed partition or the archive never reach it
+# (see insert_traffic_rows), so each minute is counted once.
+ROLLUP_TRIGGER = f"""
+CREATE TRIGGER IF NOT EXISTS {HOT_TABLE}_rollup_insert
+AFTER INSERT ON {HOT_TABLE}
+BEGIN
+  INSERT INTO traffic_hourly_monitor
+  VALUES (
+    NEW.metro_id, NEW.monitor_id, substr(NEW.observed_at, 1, 13) || ':00:00', 1, NEW.vehicles,
+    COALESCE(NEW.speed, 0), NEW.speed IS NOT NULL, COALESCE(NEW.occupancy, 0), NEW.occupancy IS NOT NULL
+  )
+  ON CONFLICT(metro_id, monitor_id, hour_at) DO UPDATE SET
+    n = n + 1,
+    vehicles_sum = vehicles_sum + excluded.vehicles_sum,
+    speed_sum = speed_sum + excluded.speed_sum,
+    speed_n = speed_n + excluded.speed_n,
+    occupancy_sum = occupancy_sum + excluded.occupancy_sum,
+    occupancy_n = occupancy_n + excluded.occupancy_n;
+
+  INSERT INTO traffic_hourly_metro
+  VALUES (NEW.metro_id, substr(NEW.observed_at, 1, 13) || ':00:00', 1, NEW.vehicles)
+  ON CONFLICT(metro_id, hour_at) DO UPDATE SET
+    n = n + 1, vehicles_sum = vehicles_sum + excluded.vehicles_sum;
+
+  INSERT INTO traffic_daily_metro
+  VALUES (NEW.metro_id, substr(NEW.observed_at, 1, 10), 1, NEW.vehicles)
+  ON CONFLICT(metro_id, day) DO UPDATE SET
+    n = n + 1, vehicles_sum = vehicles_sum + excluded.vehicles_sum;
+END
+"""
+
+
+def ensure_rollups(conn: sqlite3.Connection) -> None:
+    """Create the rollup tables and insert trigger; fill them from raw rows the first time."""
+    created = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'traffic_hourly_monitor'"
+    ).fetchone() is None
+    for name, columns in ROLLUP_SCHEMA.items():
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {name} ({columns}) WITHOUT ROWID")
+    conn.execute(ROLLUP_TRIGGER)
+    conn.commit()
+    if created:
+        rebuild_rollups(conn)
+
+
+def rebuild_rollups(conn: sqlite3.Connection) -> None:
+    """
+    Recompute every rollup from the raw rows in the hot table and partitions.
+
+    A hot-table row that is also in a sealed partition (e.g. inserted before
+    duplicates were checked across partitions) is counted once, as compaction
+    would keep it. Months already archived to Parquet keep their hourly rows as
+    they are, since their raw minutes are no longer in SQLite.
+    """
+    archived = f"substr({{col}}, 1, 7) IN (SELECT month FROM {ARCHIVE_TABLE})"
+    partitions = [r[0] for r in conn.execute(f"SELECT name FROM {CATALOG_TABLE} ORDER BY month")]
+    not_sealed = "".join(
+        f"\n              AND NOT EXISTS (SELECT 1 FROM {name} p WHERE p.metro_id = h.metro_id"
+        f" AND p.monitor_id = h.monitor_id AND p.observed_at = h.observed_at)"
+        for name in partitions
+    )
+    raw = "\n            UNION ALL\n".join(
+        [f"SELECT {COLUMNS} FROM {name}" for name in partitions]
+        + [f"SELECT {COLUMNS} FROM {HOT_TABLE} h WHERE 1{not_sealed}"]
+    )
+    with conn:
+        conn.execute(f"DELETE FROM traffic_hourly_monitor WHERE NOT {archived.format(col='hour_at')}")
+        for name in ROLLUP_TABLES[1:]:
+            conn.execute(f"DELETE FROM {name}")
+        conn.execute(
+            f"""
+            INSERT INTO traffic_hourly_monitor
+            SELECT metro_id, monitor_id, substr(observed_at, 1, 13) || ':00:00', COUNT(*), SUM(vehicles),
+                   COALESCE(SUM(speed), 0), COUNT(speed), COALESCE(SUM(occupancy), 0), COUNT(occupancy)
+            FROM (
+            {raw}
+            )
+            WHERE NOT {archived.format(col='observed_at')}
+            GROUP BY 1, 2, 3
+        """
+        )
+        # The coarser rollups are built from the hourly one, not from raw minutes.
+        conn.execute(
+            """
+            INSERT INTO traffic_hourly_metro
+            SELECT metro_id, hour_at, SUM(n), SUM(vehicles_sum)
+            FROM traffic_hourly_monitor
+            GROUP BY 1, 2
+        """
+        )
+        conn.execute(
+            """
+            INSERT INTO traffic_daily_metro
+            SELECT metro_id, substr(hour_at, 1, 10), SUM(n), SUM(vehicles_sum)
+            FROM traffic_hourly_metro
+            GROUP BY 1, 2
+        """
+        )
+
+
+# 5. PARQUET ARCHIVE ###################################
+
+def _archive_schema():
+    import pyarrow as pa
+
+    return pa.schema(
+        [
+            ("monitor_id", pa.string()),
+            ("observed_at", pa.timestamp("s", tz="UTC")),
+            ("vehicles", pa.int32()),
+            ("speed", pa.float32()),
+            ("occupancy", pa.float32()),
+            ("metro_id", pa.int32()),
+            ("date", pa.date32()),
+        ]
+    )
+
+
+def _archive_partitioning():
+    """Hive-style folders: metro_id=948/date=2026-04-01/."""
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    schema = _archive_schema()
+    return ds.partitioning(pa.schema([schema.field("metro_id"), schema.field("date")]), flavor="hive")
+
+
+def archive_partitions(conn: sqlite3.Connection, archive_dir: Path, keep_months: int = 0) -> list[str]:
+    """
+    Export sealed monthly partitions to Parquet and drop them from SQLite.
+
+    Files are written as archive_dir/metro_id=<id>/date=<YYYY-MM-DD>/<batch>-0.parquet,
+    sorted by monitor and time, so readers can skip whole folders by metro/date and
+    whole row groups by the observed_at min/max statistics. The newest `keep_months`
+    sealed partitions stay in SQLite. Returns the partitions archived.
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    partitions = conn.execute(f"SELECT name, month FROM {CATALOG_TABLE} ORDER BY month").fetchall()
+    partitions = partitions[: max(len(partitions) - keep_months, 0)]
+    schema = _archive_schema()
+
+    archived = []
+    for name, month in partitions:
+        rows = conn.execute(
+            f"""
+            SELECT monitor_id, observed_at, vehicles, speed, occupancy, metro_id, substr(observed_at, 1, 10)
+            FROM {name}
+            ORDER BY metro_id, substr(observed_at, 1, 10), monitor_id, observed_at
+        """
+        ).fetchall()
+
+        # A month that was archived before only gets its new minutes exported,
+        # so late or backfilled rows never add a second copy of archived rows.
+        if conn.execute(f"SELECT 1 FROM {ARCHIVE_TABLE} WHERE month = ?", (month,)).fetchone():
+            keys = {metro_id: archived_keys(archive_dir, metro_id, month) for metro_id in {r[5] for r in rows}}
+            rows = [r for r in rows if (r[0], r[1]) not in keys[r[5]]]
+            if not rows:
+                with conn:
+                    conn.execute(f"DROP TABLE {name}")
+                    conn.execute(f"DELETE FROM {CATALOG_TABLE} WHERE name = ?", (name,))
+                    refresh_all_view(conn)
+                archived.append(name)
+                continue
+
+        columns = list(zip(*rows)) if rows else [[] for _ in schema]
+        table = pa.table(
+            {
+                "monitor_id": pa.array(columns[0], pa.string()),
+                "observed_at": pa.array(columns[1], pa.string()).cast(pa.timestamp("s")).cast(schema.field("observed_at").type),
+                "vehicles": pa.array(columns[2], pa.int32()),
+                "speed": pa.array(columns[3], pa.float32()),
+                "occupancy": pa.array(columns[4], pa.float32()),
+                "metro_id": pa.array(columns[5], pa.int32()),
+                "date": pa.array(columns[6], pa.string()).cast(pa.date32()),
+            },
+            schema=schema,
+        )
+
+        # Each export gets its own file name, so late rows for a month that was
+        # already archived are added next to the earlier files, never over them.
+        archived_at = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+        # The batch number keeps two exports of one month in the same second apart.
+        number = conn.execute(f"SELECT COUNT(*) FROM {ARCHIVE_TABLE} WHERE month = ?", (month,)).fetchone()[0]
+        batch = f"{name}-{archived_at.replace(' ', 'T').replace(':', '')}-{number}"
+        ds.write_dataset(
+            table,
+            str(archive_dir),
+            format="parquet",
+            partitioning=_archive_partitioning(),
+            basename_template=f"{batch}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+            max_rows_per_group=64 * 1024,
+        )
+
+        # Only drop the SQLite copy once the new files read back with the same row count.
+        files = [str(f) for f in Path(archive_dir).rglob(f"{batch}-*.parquet")]
+        written_rows = ds.dataset(files, format="parquet").count_rows() if files else 0
+        if written_rows != len(rows):
+            raise RuntimeError(f"archive of {name} wrote {written_rows} rows, expected {len(rows)}")
+
+        with conn:
+            conn.execute(f"DROP TABLE {name}")
+            conn.execute(f"DELETE FROM {CATALOG_TABLE} WHERE name = ?", (name,))
+            conn.execute(f"INSERT INTO {ARCHIVE_TABLE} VALUES (?, ?, ?, ?)", (batch, month, len(rows), archived_at))
+            refresh_all_view(conn)
+        archived.append(name)
+
+    if archived:
+        conn.execute("VACUUM")
+    return archived
+
+
+def scan_archive(
+    archive_dir: Path,
+    columns: list[str],
+    metro_id: int,
+    start: str | None = None,
+    end: str | None = None,
+    batch_size: int = 100_000,
+):
+    """
+    Stream archived rows with start <= observed_at < end as pyarrow RecordBatches.
+
+    The metro_id/date filters prune folders before any file is opened, and the
+    observed_at filter is checked against row-group statistics, so only the
+    matching part of the archive is read. Yields nothing if there is no archive.
+    """
+    if not Path(archive_dir).exists() or not any(Path(archive_dir).rglob("*.parquet")):
+        return
+    import pyarrow.dataset as ds
+
+    dataset = ds.dataset(str(archive_dir), schema=_archive_schema(), format="parquet", partitioning=_archive_partitioning())
+    condition = ds.field("metro_id") == metro_id
+    if start is not None:
+        start_at = datetime.fromisoformat(start).replace(tzinfo=timezone.utc)
+        condition &= (ds.field("date") >= start_at.date()) & (ds.field("observed_at") >= start_at)
+    if end is not None:
+        end_at = datetime.fromisoformat(end).replace(tzinfo=timezone.utc)
+        condition &= (ds.field("date") <= end_at.date()) & (ds.field("observed_at") < end_at)
+    for batch in dataset.to_batches(columns=columns, filter=condition, batch_size=batch_size):
+        if batch.num_rows:
+            yield batch
+
+
+# 6. SPOOL ###################################
+
+class RowSpool:
+    """
+    Append-only spool of row batches, stored as segment files in one folder.
+
+    A segment moves through three names:
+    - <id>.open: being appended to (one JSON batch per line, fsynced)
+    - <id>.ready: sealed, waiting to be flushed into SQLite
+    - <id>.flushing: claimed by a flusher; deleted once its rows are committed
+    Renames are atomic, so two processes never flush the same segment, and a
+    segment is only deleted after its transaction commits. Re-flushing a segment
+    after a crash is harmless, because inserts ignore rows that already exist.
+    """
+
+    def __init__(self, spool_dir: Path, segment_bytes: int = SPOOL_SEGMENT_BYTES):
+        self.dir = Path(spool_dir)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.segment_bytes = segment_bytes
+        self.lock = threading.Lock()
+        self.open_path = None
+
+    def append(self, batch: dict) -> None:
+        """Durably append one batch (a JSON-serializable dict) to the open segment."""
+        line = json.dumps(batch, separators=(",", ":")) + "\n"
+        with self.lock:
+            if self.open_path is None:
+                self.open_path = self.dir / f"{time.time_ns()}-{os.getpid()}.open"
+            with open(self.open_path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            if self.open_path.stat().st_size >= self.segment_bytes:
+                self._seal()
+
+    def seal(self) -> None:
+        """Close the open segment so a flusher can pick it up."""
+        with self.lock:
+            self._seal()
+
+    def _seal(self) -> None:
+        if self.open_path is not None and self.open_path.exists():
+            self.open_path.rename(self.open_path.with_suffix(".ready"))
+        self.open_path = None
+
+    def claim(self) -> list[Path]:
+        """Claim every ready segment, oldest first (including ones abandoned by a crash)."""
+        now = time.time()
+        with self.lock:
+            for path in list(self.dir.glob("*.open")) + list(self.dir.glob("*.flushing")):
+                try:
+                    if path != self.open_path and now - path.stat().st_mtime > SPOOL_STALE_SECONDS:
+                        path.rename(path.with_suffix(".ready"))
+                except FileNotFoundError:
+                    continue
+        claimed = []
+        for path in sorted(self.dir.glob("*.ready")):
+            try:
+                # Touch first, so a slow flush is not mistaken for a crashed one.
+                os.utime(path)
+                path.rename(path.with_suffix(".flushing"))
+            except FileNotFoundError:
+                continue  # another flusher claimed it first
+            claimed.append(path.with_suffix(".flushing"))
+        return claimed
+
+    @staticmethod
+    def read(path: Path) -> list[dict]:
+        """Read the batches in a segment, skipping a torn last line from a crash mid-write."""
+        batches = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    batches.append(json.loads(line))
+                except json.JSONDecodeError:
+                    print(f"   warning skipped a partial batch in {path.name}")
+        return batches
+
+    @staticmethod
+    def release(paths: list[Path], done: bool) -> None:
+        """Delete flushed segments, or hand them back as ready if the flush failed."""
+        for path in paths:
+            if done:
+                path.unlink(missing_ok=True)
+            elif path.exists():
+                path.rename(path.with_suffix(".ready"))
+
+    def backlog(self) -> int:
+        """Number of sealed segments not yet flushed."""
+        return len(list(self.dir.glob("*.ready"))) + len(list(self.dir.glob("*.flushing")))
@@ -0,0 +1,129 @@
+# splits.py
+# Deterministic Splits and Time-Series Cross-Validation
+# Pairs with 02_train_model.py
+# Tim Fraser
+
+# Every split here is a NumPy index array or mask drawn from a seeded generator,
+# so the same data always splits the same way. Benchmarks and model
+# comparisons are repeatable, with no row IDs to hash or anti-join.
+# - seeded_split: random train/test split as index arrays, in memory or chunk by chunk
+# - rolling_origin_folds: time-series folds that always validate on later rows
+# - evaluate_folds: fit and score every fold in parallel
+
+# 0. SETUP ###################################
+
+## 0.1 Load Packages #################################
+
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import xgboost as xgb
+
+# 1. RANDOM SPLITS ###################################
+
+def train_mask(rng: np.random.Generator, n: int, train_fraction: float) -> np.ndarray:
+    """Boolean mask of the next n rows that go to training."""
+    return rng.random(n) < train_fraction
+
+
+def seeded_split(
+    n: int, train_fraction: float = 0.8, seed: int | np.random.Generator = 42
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Return (train, test) row index arrays for n rows.
+
+    `seed` can also be a Generator: splitting chunk after chunk with the same
+    generator draws one number per row in order, so each row lands on the same
+    side however the rows are chunked.
+    """
+    in_train = train_mask(np.random.default_rng(seed), n, train_fraction)
+    return np.flatnonzero(in_train), np.flatnonzero(~in_train)
+
+
+# 2. ROLLING-ORIGIN FOLDS ###################################
+
+def rolling_origin_folds(
+    times: np.ndarray, folds: int = 4, horizon: int = 7, min_train: int = 1
+) -> list[tuple[np.ndarray, np.ndarray]]:
+    """
+    Expanding-window folds over integer times (e.g. day numbers).
+
+    The last `folds` blocks of `horizon` time units are the validation sets.
+    Each fold trains on every row before its block, like retraining on all
+    history and forecasting the next week. Returns (train, valid) row index
+    arrays, oldest fold first; folds with fewer than min_train training rows
+    or no validation rows are skipped.
+    """
+    order = np.argsort(times, kind="stable")
+    sorted_times = times[order]
+    end = sorted_times[-1] + 1
+    result = []
+    for origin in end - horizon * np.arange(folds, 0, -1):
+        cut, stop = np.searchsorted(sorted_times, [origin, origin + horizon])
+        if cut >= min_train and stop > cut:
+            # Sorted indexes keep the row gathers (X[train]) sequential in memory.
+            result.append((np.sort(order[:cut]), np.sort(order[cut:stop])))
+    return result
+
+
+# 3. PARALLEL FOLD EVALUATION ###################################
+
+# Data for the fold workers, set before they fork so they share it without copying.
+_folds = {}
+
+
+def _fit_fold(fold: int) -> dict:
+    """Train on one fold's training rows and score its validation rows."""
+    start = time.perf_counter()
+    X, y, w = _folds["X"], _folds["y"], _folds["w"]
+    train, valid = _folds["folds"][fold]
+    nthread = _folds["nthread"]
+    dtrain = xgb.QuantileDMatrix(
+        X[train], y[train], weight=w[train], feature_names=_folds["feature_names"], nthread=nthread
+    )
+    booster = xgb.train({**_folds["params"], "nthread": nthread}, dtrain, num_boost_round=_folds["rounds"])
+    residual = y[valid] - booster.inplace_predict(X[valid])
+    return {
+        "fold": fold + 1,
+        "train_rows": len(train),
+        "valid_rows": len(valid),
+        "rmse": float(np.sqrt(np.sum(w[valid] * residual**2) / np.sum(w[valid]))),
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+
+
+def evaluate_folds(
+    params: dict,
+    rounds: int,
+    X: np.ndarray,
+    y: np.ndarray,
+    w: np.ndarray,
+    folds: list[tuple[np.ndarray, np.ndarray]],
+    feature_names: list[str],
+    workers: int | None = None,
+) -> list[dict]:
+    """
+    Fit and score every fold, several at a time, and return one result per fold.
+
+    Workers are forked, so they read X, y and w from this process's memory
+    instead of receiving copies. As in tuning.py, cores are divided between
+    workers so XGBoost's own threads do not oversubscribe the machine; without
+    fork (Windows), folds run one after another.
+    """
+    cores = os.cpu_count() or 1
+    workers = max(1, min(workers or cores, len(folds)))
+    _folds.update(
+        X=X, y=y, w=w, folds=folds, params=params, rounds=rounds,
+        feature_names=feature_names, nthread=max(1, cores // workers),
+    )
+    try:
+        if workers > 1 and "fork" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("fork")
+            with ProcessPoolExecutor(workers, mp_context=context) as pool:
+                return list(pool.map(_fit_fold, range(len(folds))))
+        return [_fit_fold(fold) for fold in range(len(folds))]
+    finally:
+        _folds.clear()
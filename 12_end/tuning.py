@@ -0,0 +1,139 @@
+# tuning.py
+# Hyperparameter Search for the Traffic Model
+# Pairs with 02_train_model.py (--tune)
+# Tim Fraser
+
+# Runs a bounded random search over XGBoost parameters on a process pool.
+# Each worker builds its training and validation matrices once, from the .npz
+# chunk files written by 02_train_model.py, and reuses them for every trial it
+# runs. Each trial uses early stopping on the held-out (most recent) rows.
+
+# 0. SETUP ###################################
+
+## 0.1 Load Packages #################################
+
+import itertools
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import xgboost as xgb
+
+## 0.2 Search Space #################################
+
+# Candidate values per parameter; the grid is every combination (96 here).
+SEARCH_SPACE = {
+    "max_depth": [3, 4, 6, 8],
+    "eta": [0.03, 0.1, 0.3],
+    "min_child_weight": [1, 10],
+    "subsample": [0.8, 1.0],
+    "lambda": [1.0, 10.0],
+}
+
+# Upper bound on boosting rounds; early stopping usually ends a trial well before it.
+MAX_ROUNDS = 500
+EARLY_STOPPING_ROUNDS = 20
+
+
+# 1. DATA ###################################
+
+class NpzIter(xgb.DataIter):
+    """Feeds (X, y, w) .npz chunk files to XGBoost one at a time."""
+
+    def __init__(self, files: list[Path], feature_names: list[str]):
+        self.files = files
+        self.feature_names = feature_names
+        self.position = 0
+        super().__init__()
+
+    def reset(self) -> None:
+        self.position = 0
+
+    def next(self, input_data) -> bool:
+        if self.position == len(self.files):
+            return False
+        with np.load(self.files[self.position]) as chunk:
+            input_data(data=chunk["X"], label=chunk["y"], weight=chunk["w"], feature_names=self.feature_names)
+        self.position += 1
+        return True
+
+
+# Matrices built once per worker process by _init_worker(), then shared by all its trials.
+_worker = {}
+
+
+def _init_worker(train_files: list[Path], valid_files: list[Path], feature_names: list[str], nthread: int) -> None:
+    dtrain = xgb.QuantileDMatrix(NpzIter(train_files, feature_names), nthread=nthread)
+    # ref=dtrain bins the validation rows with the training bins.
+    dvalid = xgb.QuantileDMatrix(NpzIter(valid_files, feature_names), ref=dtrain, nthread=nthread)
+    _worker.update(dtrain=dtrain, dvalid=dvalid, nthread=nthread)
+
+
+# 2. SEARCH ###################################
+
+def sample_trials(trials: int, seed: int = 42) -> list[dict]:
+    """Draw `trials` distinct parameter sets from SEARCH_SPACE (the whole grid if it is smaller)."""
+    grid = [dict(zip(SEARCH_SPACE, values)) for values in itertools.product(*SEARCH_SPACE.values())]
+    if trials >= len(grid):
+        return grid
+    return random.Random(seed).sample(grid, trials)
+
+
+def _run_trial(base_params: dict, trial_params: dict) -> dict:
+    """Train one candidate with early stopping and return its leaderboard row."""
+    start = time.perf_counter()
+    params = {**base_params, **trial_params, "nthread": _worker["nthread"]}
+    booster = xgb.train(
+        params,
+        _worker["dtrain"],
+        num_boost_round=MAX_ROUNDS,
+        evals=[(_worker["dvalid"], "valid")],
+        early_stopping_rounds=EARLY_STOPPING_ROUNDS,
+        verbose_eval=False,
+    )
+    return {
+        "params": trial_params,
+        "rounds": booster.best_iteration + 1,
+        "valid_rmse": float(booster.best_score),
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+
+
+def run_search(
+    base_params: dict,
+    train_files: list[Path],
+    valid_files: list[Path],
+    feature_names: list[str],
+    trials: int = 12,
+    workers: int | None = None,
+    seed: int = 42,
+) -> list[dict]:
+    """
+    Evaluate sampled parameter sets and return the leaderboard, best (lowest validation RMSE) first.
+
+    Trials run on `workers` processes (default: one per core, at most one per
+    trial). Cores are divided between them, so XGBoost gets cores // workers
+    threads per trial and the machine is never oversubscribed.
+    """
+    candidates = sample_trials(trials, seed)
+    cores = os.cpu_count() or 1
+    workers = max(1, min(workers or cores, len(candidates)))
+    nthread = max(1, cores // workers)
+    init_args = (train_files, valid_files, feature_names, nthread)
+
+    # Workers are forked, so they start from the already-imported modules
+    # instead of re-running the training script. Where fork is not available
+    # (Windows), trials run one after another in this process.
+    if workers > 1 and "fork" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("fork")
+        with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker, initargs=init_args) as pool:
+            results = list(pool.map(_run_trial, itertools.repeat(base_params), candidates))
+    else:
+        _init_worker(*init_args)
+        results = [_run_trial(base_params, trial_params) for trial_params in candidates]
+        _worker.clear()
+    return sorted(results, key=lambda row: row["valid_rmse"])
@@ -8,7 +8,7 @@ import requests
 
 # Add the 08_function_calling folder to path so we can import functions.py
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "08_function_calling"))
-from functions import agent_run
+from functions import agent_run, tool, tool_metadata
 
 # Path to the BDS yearly aggregate CSV
 DATA_PATH = os.path.join(os.path.dirname(__file__), "data", "pipeline", "bds_yearly_aggregate.csv")
@@ -18,6 +18,7 @@ MODEL = "smollm2:1.7b"
 
 # 1. DEFINE CUSTOM TOOL FUNCTION ###################################
 
+@tool
 def get_bds_yearly_stats(year):
     """
     Look up total job creation value for a given year from the BDS yearly aggregate CSV.
@@ -45,26 +46,8 @@ def get_bds_yearly_stats(year):
 
 # 2. DEFINE TOOL METADATA ###################################
 
-tool_get_bds_yearly_stats = {
-    "type": "function",
-    "function": {
-        "name": "get_bds_yearly_stats",
-        "description": (
-            "Look up the total job creation value for a specific year "
-            "from the BDS (Business Dynamics Statistics) yearly aggregate dataset."
-        ),
-        "parameters": {
-            "type": "object",
-            "required": ["year"],
-            "properties": {
-                "year": {
-                    "type": "integer",
-                    "description": "The year to look up, e.g. 2019"
-                }
-            }
-        }
-    }
-}
+# Metadata is generated from the function signature and docstring by @tool
+tool_get_bds_yearly_stats = tool_metadata(get_bds_yearly_stats)
 
 # 3. AGENT 1: FETCH DATA USING THE TOOL ###################################
 